@@ -4,6 +4,8 @@
 
 import random
 import math
+import numpy as np
+from genetics import generation_rng, crossover, mutate
 
 # Returns sigmoid normalized between -1 and 1
 
@@ -12,6 +14,12 @@ def normalized_sigmoid(x):
     return (2 / (1 + math.exp(-x))) - 1
 
 
+# Elementwise normalized_sigmoid over arrays. 2 / (1 + e^-x) - 1 equals
+# tanh(x / 2), which does not overflow for large negative x.
+def batch_normalized_sigmoid(x):
+    return np.tanh(np.asarray(x) / 2)
+
+
 class FC_NNLayer():
 
     # Fully connected Layer
@@ -21,8 +29,9 @@ class FC_NNLayer():
         self.input_dim = input_dim
         self.output_dim = output_dim
 
-        self.weights = [[0] * input_dim] * output_dim
-        self.biases = [0] * output_dim
+        # Arrays, so every output row owns its weights
+        self.weights = np.zeros((output_dim, input_dim))
+        self.biases = np.zeros(output_dim)
 
     def randomize_weights_biases(self, min, max):
         for o in range(self.output_dim):
@@ -31,14 +40,35 @@ class FC_NNLayer():
             self.biases[o] = random.uniform(min, max)
 
     def forward(self, input):
-        output = []
-        for o in range(self.output_dim):
-            sum = 0
-            for i in range(self.output_dim):
-                sum += input[i] * self.weights[o][i]
-            sum += self.biases[o]
-            output.append(normalized_sigmoid(sum))
-        return output
+        assert len(input) == self.input_dim, \
+            "Input must have one value per input of the layer"
+        input = np.asarray(input, dtype=np.float64)
+        return batch_normalized_sigmoid(self.weights @ input + self.biases)
+
+    # Stacks the weights and biases of equivalent layers into arrays of shape
+    # (layers, output_dim, input_dim) and (layers, output_dim)
+    @classmethod
+    def stack_layers(cls, layers):
+        assert all(
+            layer.input_dim == layers[0].input_dim and
+            layer.output_dim == layers[0].output_dim for layer in layers
+        ), "Input and output dimensions of stacked layers must be the same"
+
+        weights = np.array([layer.weights for layer in layers],
+                           dtype=np.float64)
+        biases = np.array([layer.biases for layer in layers],
+                          dtype=np.float64)
+        return weights, biases
+
+    # forward() for a stack of layers with one input row per layer, done as a
+    # single batched matrix multiply
+    @staticmethod
+    def batch_forward(weights, biases, input):
+        input = np.asarray(input, dtype=np.float64)
+        assert input.shape[1] == weights.shape[2], \
+            "Input must have one column per input of the layers"
+        sum = np.matmul(weights, input[:, :, None])[:, :, 0] + biases
+        return batch_normalized_sigmoid(sum)
 
     # Output a random combination of weights from one equivalent FC_NNLayer
     # itself. Used for creating evolutionary children.
@@ -49,21 +79,17 @@ class FC_NNLayer():
             layer_1.output_dim == layer_2.output_dim
         ), "Input and output dimensions of mixing partners must be the same"
 
+        rng = generation_rng()
         mixed_layer = cls(layer_1.input_dim, layer_1.output_dim)
-        for o in range(layer_1.output_dim):
-            for i in range(layer_1.input_dim):
-                if (random.random() < weighting_1):
-                    mixed_layer.weights[o][i] = layer_1.weights[o][i]
-                else:
-                    mixed_layer.weights[o][i] = layer_2.weights[o][i]
-            if (random.random() < weighting_1):
-                mixed_layer.biases[o] = layer_1.biases[o]
-            else:
-                mixed_layer.biases[o] = layer_2.biases[o]
+        mixed_layer.weights = crossover(
+            rng, np.asarray(layer_1.weights), np.asarray(layer_2.weights),
+            weighting_1)
+        mixed_layer.biases = crossover(
+            rng, np.asarray(layer_1.biases), np.asarray(layer_2.biases),
+            weighting_1)
         return mixed_layer
 
     # Mutates a random weight
     def mutate_layer(self, min, max):
-        o = random.randint(0, self.output_dim - 1)
-        i = random.randint(0, self.input_dim - 1)
-        self.weights[o][i] += random.uniform(min, max)
+        mutate(generation_rng(), np.reshape(self.weights, (1, -1)),
+               [(0, self.output_dim * self.input_dim, min, max)])
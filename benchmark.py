@@ -0,0 +1,243 @@
+"""
+    Throughput benchmarks for physics, sensors, inference, evolution and
+    full headless generations.
+    Sweeps population sizes and levels and writes the results as JSON, one
+    record per (component, implementation, level, population).
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import numpy as np
+from objects import LiDAR_Car
+from drivers import One_Hidden_NN_Driver
+from ann import FC_NNLayer
+from level import load_level
+from physics import LiDAR_Car_Population
+from collision import beam_hits
+from simulation import Simulation
+
+POPULATIONS = [60, 600, 6000]
+LEVELS = ["levels/straight.json", "levels/turn.json"]
+BENCH_FRAMES = 20
+
+
+def random_commands(frames, population):
+    rng = np.random.default_rng(0)
+    return (rng.uniform(-0.2, 1, (frames, population)),
+            rng.uniform(-1, 1, (frames, population)))
+
+
+def lidar_cars(level, population):
+    cars = [LiDAR_Car(level.start_x, level.start_y, level.start_angle)
+            for _ in range(population)]
+    forward, turn_left = random_commands(50, population)
+    for f in range(50):
+        for i, car in enumerate(cars):
+            car.apply_command(forward[f, i], turn_left[f, i])
+            car.simulate_friction()
+            car.position_frame_update()
+    return cars
+
+
+# Each bench_* function simulates frames of a population and returns the
+# frames timed and the seconds they took
+
+def bench_physics_scalar(level, population, frames):
+    cars = lidar_cars(level, population)
+    start = time.perf_counter()
+    for f in range(frames):
+        for car in cars:
+            car.position_frame_update()
+    return frames, time.perf_counter() - start
+
+
+def bench_physics_batched(level, population, frames):
+    pop = LiDAR_Car_Population(population, level.start_x, level.start_y,
+                               level.start_angle)
+    pop.load_cars(lidar_cars(level, population))
+    start = time.perf_counter()
+    for f in range(frames):
+        pop.position_frame_update()
+    return frames, time.perf_counter() - start
+
+
+def bench_lidar_scalar(level, population, frames):
+    cars = lidar_cars(level, population)
+    rects = level.obstacles + level.borders
+    start = time.perf_counter()
+    for f in range(frames):
+        for car in cars:
+            for rect in rects:
+                car.beam_collide_rect_register(rect)
+    return frames, time.perf_counter() - start
+
+
+def bench_lidar_batched(level, population, frames):
+    pop = LiDAR_Car_Population(population, level.start_x, level.start_y,
+                               level.start_angle)
+    pop.load_cars(lidar_cars(level, population))
+    origins = np.column_stack((pop.x, pop.y))
+    start = time.perf_counter()
+    for f in range(frames):
+        pop.beam_collided |= beam_hits(
+            origins, pop.beam_endpoints, level.crash_index.query_rects(
+                np.broadcast_to(origins[:, None, :], pop.beam_endpoints.shape),
+                pop.beam_endpoints))
+    return frames, time.perf_counter() - start
+
+
+def bench_inference_scalar(level, population, frames):
+    layers = [FC_NNLayer(4, 4) for _ in range(population)]
+    for layer in layers:
+        layer.randomize_weights_biases(-2, 2)
+    inputs = np.random.default_rng(0).uniform(0, 1, (population, 4)).tolist()
+    start = time.perf_counter()
+    for f in range(frames):
+        for layer, input in zip(layers, inputs):
+            layer.forward(input)
+    return frames, time.perf_counter() - start
+
+
+def bench_inference_batched(level, population, frames):
+    layers = [FC_NNLayer(4, 4) for _ in range(population)]
+    for layer in layers:
+        layer.randomize_weights_biases(-2, 2)
+    weights, biases = FC_NNLayer.stack_layers(layers)
+    inputs = np.random.default_rng(0).uniform(0, 1, (population, 4))
+    start = time.perf_counter()
+    for f in range(frames):
+        FC_NNLayer.batch_forward(weights, biases, inputs)
+    return frames, time.perf_counter() - start
+
+
+# A "frame" of mating breeds a whole generation of children
+def bench_mate(level, population, frames):
+    car = LiDAR_Car(level.start_x, level.start_y, level.start_angle)
+    parents = [One_Hidden_NN_Driver(car) for _ in range(2)]
+    start = time.perf_counter()
+    for f in range(frames):
+        for i in range(population):
+            One_Hidden_NN_Driver.mate(parents[0], parents[1], car)
+    return frames, time.perf_counter() - start
+
+
+def bench_breed(level, population, frames):
+    cars = [LiDAR_Car(level.start_x, level.start_y, level.start_angle)
+            for _ in range(population)]
+    parents = [One_Hidden_NN_Driver(cars[0]) for _ in range(2)]
+    start = time.perf_counter()
+    for f in range(frames):
+        One_Hidden_NN_Driver.breed(parents, cars)
+    return frames, time.perf_counter() - start
+
+
+# Full headless generations, including evolution; frames are the frames
+# actually simulated, which may end early
+def bench_generation(level, population, generations):
+    sim = Simulation(level, gen_size=population)
+    frames = 0
+    start = time.perf_counter()
+    for g in range(generations):
+        if g > 0:
+            sim.next_gen()
+        sim.run_gen()
+        frames += sim.gen_cur_frame
+    return frames, time.perf_counter() - start
+
+
+BENCHMARKS = [
+    ("physics", "scalar", bench_physics_scalar),
+    ("physics", "batched", bench_physics_batched),
+    ("lidar", "scalar", bench_lidar_scalar),
+    ("lidar", "batched", bench_lidar_batched),
+    ("inference", "scalar", bench_inference_scalar),
+    ("inference", "batched", bench_inference_batched),
+    ("mate", "scalar", bench_mate),
+    ("mate", "batched", bench_breed),
+    ("generation", "headless", bench_generation),
+]
+
+
+def run_benchmarks(levels=LEVELS, populations=POPULATIONS,
+                   frames=BENCH_FRAMES, generations=1, components=None,
+                   log=None):
+    results = []
+    for level_path in levels:
+        level = load_level(level_path)
+        for population in populations:
+            for component, impl, bench in BENCHMARKS:
+                if components is not None and component not in components:
+                    continue
+                random.seed(0)
+                if component == "generation":
+                    timed_frames, seconds = bench(level, population,
+                                                  generations)
+                else:
+                    timed_frames, seconds = bench(level, population, frames)
+                result = {
+                    "component": component,
+                    "impl": impl,
+                    "level": level_path,
+                    "population": population,
+                    "frames": timed_frames,
+                    "seconds": seconds,
+                    "frames_per_sec": timed_frames / seconds,
+                    "car_steps_per_sec": timed_frames * population / seconds,
+                }
+                results.append(result)
+                if log is not None:
+                    log(result)
+    return results
+
+
+def print_result(result):
+    print("{level} {population:>6} {component:<10} {impl:<8} "
+          "{frames_per_sec:>12.1f} frames/s {car_steps_per_sec:>14.1f} "
+          "car-steps/s".format(**result), file=sys.stderr)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark simulation throughput.")
+    parser.add_argument("--levels", nargs="+", default=LEVELS)
+    parser.add_argument("--populations", nargs="+", type=int,
+                        default=POPULATIONS)
+    parser.add_argument("--frames", type=int, default=BENCH_FRAMES,
+                        help="frames timed per component benchmark")
+    parser.add_argument("--generations", type=int, default=1,
+                        help="generations timed per full generation "
+                        "benchmark")
+    parser.add_argument("--components", nargs="+", default=None,
+                        choices=sorted({b[0] for b in BENCHMARKS}),
+                        help="only run these components")
+    parser.add_argument("--output", default=None,
+                        help="JSON file to write (default stdout)")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    results = run_benchmarks(args.levels, args.populations, args.frames,
+                             args.generations, args.components,
+                             log=print_result)
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+    Uniform grid spatial index over level rects.
+    Narrows collision tests down to the rects near each segment (LiDAR beam
+    or car body edge).
+"""
+
+import math
+import numpy as np
+from collision import EMPTY_RECT
+
+GRID_CELL_SIZE = 16
+# Below this many rects, testing all of them is faster than querying the grid
+BROADPHASE_MIN_RECTS = 16
+
+
+class Grid_Index():
+
+    # Buckets a (rects, 4) array (see collision.rects_to_array) into square
+    # grid cells. Each cell lists the rects near it, padded to the same length
+    # with the index of an empty rect.
+    #
+    # Segments are queried by sampling points along them at most cell_size
+    # apart, so every point of a segment is within cell_size / 2 of a sample.
+    # Rects are bucketed with that margin (plus a pixel for the truncation
+    # done by the collision kernel), so the cells of the samples list every
+    # rect the segment can hit.
+
+    def __init__(self, rects, cell_size=GRID_CELL_SIZE):
+        self.rects = rects
+        self.cell_size = cell_size
+        self.margin = cell_size / 2 + 1
+        # Candidate rects are gathered from here, the last row is padding
+        self.padded_rects = np.vstack((rects, EMPTY_RECT))
+        self.pad = len(rects)
+
+        if len(rects) == 0:
+            self.origin = np.zeros(2)
+            self.cols = self.rows = 1
+        else:
+            self.origin = rects[:, 0:2].min(axis=0) - self.margin
+            extent = rects[:, 2:4].max(axis=0) + self.margin - self.origin
+            self.cols = int(extent[0] // cell_size) + 1
+            self.rows = int(extent[1] // cell_size) + 1
+
+        buckets = [[] for _ in range(self.cols * self.rows)]
+        for r in range(len(rects)):
+            col_0, row_0 = self._cell(rects[r, 0:2] - self.margin)
+            col_1, row_1 = self._cell(rects[r, 2:4] + self.margin)
+            for row in range(row_0, row_1 + 1):
+                for col in range(col_0, col_1 + 1):
+                    buckets[row * self.cols + col].append(r)
+
+        width = max(1, max(len(bucket) for bucket in buckets))
+        self.cell_rects = np.full((len(buckets), width), self.pad,
+                                  dtype=np.intp)
+        for c, bucket in enumerate(buckets):
+            self.cell_rects[c, :len(bucket)] = bucket
+
+    def _cell(self, point):
+        col = min(max(int(math.floor(
+            (point[0] - self.origin[0]) / self.cell_size)), 0), self.cols - 1)
+        row = min(max(int(math.floor(
+            (point[1] - self.origin[1]) / self.cell_size)), 0), self.rows - 1)
+        return col, row
+
+    # Returns indices of the candidate rects of segments from starts to ends,
+    # both of shape (..., 2), as a (..., candidates) array padded with
+    # self.pad. Candidates are a superset of the rects the segment hits.
+    def query(self, starts, ends):
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        shape = starts.shape[:-1]
+        starts = starts.reshape(-1, 2)
+        ends = ends.reshape(-1, 2)
+
+        # Sample every segment the same number of times, enough for the
+        # longest one
+        longest = np.hypot(*(ends - starts).T).max(initial=0)
+        samples = int(math.ceil(longest / self.cell_size)) + 1
+        t = np.linspace(0, 1, samples)[None, :, None]
+        points = starts[:, None, :] + t * (ends - starts)[:, None, :]
+
+        cells = np.floor((points - self.origin) / self.cell_size)
+        cols = np.clip(cells[:, :, 0], 0, self.cols - 1).astype(np.intp)
+        rows = np.clip(cells[:, :, 1], 0, self.rows - 1).astype(np.intp)
+        candidates = self.cell_rects[rows * self.cols + cols].reshape(
+            len(starts), -1)
+
+        # Neighbouring samples share cells and rects span several cells, so
+        # drop repeats and trim the padding shared by every segment
+        candidates.sort(axis=1)
+        repeat = np.zeros(candidates.shape, dtype=bool)
+        repeat[:, 1:] = candidates[:, 1:] == candidates[:, :-1]
+        candidates[repeat] = self.pad
+        candidates.sort(axis=1)
+        width = max(1, int((candidates != self.pad).sum(axis=1).max(
+            initial=0)))
+        return candidates[:, :width].reshape(shape + (width,))
+
+    # Returns the candidate rects of each segment as a
+    # (..., candidates, 4) array, padded with empty rects. For small indexes
+    # all rects are returned as one shared (rects, 4) array instead;
+    # collision.beam_hits and body_hits accept either.
+    def query_rects(self, starts, ends):
+        if len(self.rects) < BROADPHASE_MIN_RECTS:
+            return self.rects
+        return self.padded_rects[self.query(starts, ends)]
+
+
+class Multi_Level_Index():
+
+    # Index over the rects of several levels, given one (rects, 4) array per
+    # level already shifted to where the level lies (see level.Level_Set).
+    # Segments are queried together with the level of their car. Levels with
+    # few rects give each car the rects of its own level, padded to the same
+    # number with empty rects; otherwise all levels share one Grid_Index,
+    # where segments only find rects near them and so of their own level.
+
+    def __init__(self, level_rects, cell_size=GRID_CELL_SIZE):
+        self.grid = Grid_Index(np.vstack(level_rects), cell_size)
+        self.rects = self.grid.rects
+        width = max(len(rects) for rects in level_rects)
+        self.small = width < BROADPHASE_MIN_RECTS
+        self.level_rects = np.tile(EMPTY_RECT, (len(level_rects), width, 1))
+        for level, rects in enumerate(level_rects):
+            self.level_rects[level, :len(rects)] = rects
+
+    # Returns candidate rects for segments from starts to ends, of shape
+    # (cars, ..., 2), as either a (rects, 4) array shared by all of them or
+    # a (cars, ..., candidates, 4) array, where levels holds the level of each
+    # car. collision.beam_hits and body_hits accept either.
+    def query_rects(self, starts, ends, levels):
+        if len(self.level_rects) == 1 or not self.small:
+            return self.grid.query_rects(starts, ends)
+        rects = self.level_rects[levels]
+        return rects.reshape((len(rects),) + (1,) * (np.ndim(starts) - 2) +
+                             rects.shape[1:])
@@ -0,0 +1,165 @@
+"""
+    Population checkpoints: save and resume the drivers of a simulation.
+    A checkpoint is a .npz file holding every driver's genome and class
+    settings, the scores and number of the last concluded generation and the
+    RNG state.
+"""
+
+import os
+import pickle
+import queue
+import random
+import threading
+import numpy as np
+import drivers as driver_classes
+
+ARCHIVE_SIZE = 1000
+
+
+# Returns the arrays making up a checkpoint of a concluded generation
+def population_state(sim):
+    state = {
+        "driver_class": np.array(sim.driver_class.__name__),
+        "mutation_ranges": np.array(sim.driver_class.mutation_ranges,
+                                    dtype=np.float64),
+        "genomes": np.array([driver.genome() for driver in sim.drivers]),
+        "scores": np.array(sim.driver_scores, dtype=np.float64),
+        "gen_number": np.array(sim.gen_number),
+        "rng_state": np.frombuffer(pickle.dumps(random.getstate()),
+                                   dtype=np.uint8),
+    }
+    if hasattr(sim.driver_class, "hidden_width"):
+        state["hidden_width"] = np.array(sim.driver_class.hidden_width)
+    return state
+
+
+# Writes arrays to a .npz file through a temporary file, so an interrupted
+# write never leaves a broken checkpoint behind
+def write_arrays(path, arrays):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def save_checkpoint(path, sim):
+    write_arrays(path, population_state(sim))
+
+
+def load_checkpoint(path):
+    with np.load(path) as checkpoint:
+        return {name: checkpoint[name] for name in checkpoint.files}
+
+
+# Returns the driver class of a checkpoint: the named class, or a variant of
+# it with the checkpoint's hidden width and mutation ranges (see
+# drivers.Evolvable_Driver.variant)
+def checkpoint_driver_class(checkpoint):
+    driver_class = getattr(driver_classes, str(checkpoint["driver_class"]))
+    attributes = {}
+    if "mutation_ranges" in checkpoint:
+        mutation_ranges = tuple(tuple(bounds) for bounds in
+                                checkpoint["mutation_ranges"].tolist())
+        if mutation_ranges != driver_class.mutation_ranges:
+            attributes["mutation_ranges"] = mutation_ranges
+    if "hidden_width" in checkpoint:
+        hidden_width = int(checkpoint["hidden_width"])
+        if hidden_width != driver_class.hidden_width:
+            attributes["hidden_width"] = hidden_width
+    if attributes:
+        return driver_class.variant(**attributes)
+    return driver_class
+
+
+# Returns the ranked drivers of a checkpoint, without cars. Pass them to a
+# Simulation and then restore_checkpoint() it to resume.
+def checkpoint_drivers(checkpoint):
+    driver_class = checkpoint_driver_class(checkpoint)
+    return [driver_class.from_genome(genome, None)
+            for genome in checkpoint["genomes"]]
+
+
+# Restores the generation number, scores and RNG state of a checkpoint into a
+# simulation of its drivers, so the next generation is bred exactly as it
+# would have been without stopping
+def restore_checkpoint(sim, checkpoint):
+    sim.gen_number = int(checkpoint["gen_number"])
+    sim.driver_scores = checkpoint["scores"].copy()
+    sim.gen_concluded = True
+    random.setstate(pickle.loads(checkpoint["rng_state"].tobytes()))
+
+
+class Checkpoint_Writer():
+
+    # Saves checkpoints on a background thread so the simulation doesn't
+    # wait on disk. save() only snapshots the population; a newer snapshot
+    # replaces one still waiting to be written.
+    #
+    # Optionally keeps a rolling archive of the best genome of each of the
+    # last archive_size generations.
+    #
+    # A failed write is raised again from the next save() or from close().
+
+    def __init__(self, path, archive_path=None, archive_size=ARCHIVE_SIZE):
+        self.path = path
+        self.archive_path = archive_path
+        self.archive_size = archive_size
+        self.archive = {"gen_numbers": [], "scores": [], "genomes": []}
+        if archive_path is not None and os.path.exists(archive_path):
+            with np.load(archive_path) as archive:
+                for name in self.archive:
+                    self.archive[name] = list(archive[name])
+
+        self.error = None
+        self.pending = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def save(self, sim):
+        self._raise_error()
+        state = population_state(sim)
+        if self.archive_path is not None:
+            self.archive["gen_numbers"].append(sim.gen_number)
+            self.archive["scores"].append(state["scores"][0])
+            self.archive["genomes"].append(state["genomes"][0])
+            for name in self.archive:
+                del self.archive[name][:-self.archive_size]
+            archive = {name: np.array(values)
+                       for name, values in self.archive.items()}
+        else:
+            archive = None
+
+        # Drop a snapshot which hasn't been written yet
+        try:
+            self.pending.get_nowait()
+            self.pending.task_done()
+        except queue.Empty:
+            pass
+        self.pending.put((state, archive))
+
+    def _write_loop(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            state, archive = item
+            try:
+                write_arrays(self.path, state)
+                if archive is not None:
+                    write_arrays(self.archive_path, archive)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.pending.task_done()
+
+    # Waits for the last snapshot to be written and stops the thread
+    def close(self):
+        self.pending.join()
+        self.pending.put(None)
+        self.thread.join()
+        self._raise_error()
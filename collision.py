@@ -0,0 +1,127 @@
+"""
+    Vectorized segment versus rectangle intersection (slab test).
+    Batched equivalent of pygame.Rect.clipline for car bodies and LiDAR beams.
+"""
+
+import numpy as np
+
+# Rect row that never hits, used to pad per-car candidate rect sets
+EMPTY_RECT = np.array([0, 0, -1, -1], dtype=np.float64)
+
+
+# Converts pygame.Rects to an array of shape (rects, 4) holding
+# left, top, right, bottom. Like clipline, right and bottom are the last
+# pixel inside the rect (left + width - 1).
+def rects_to_array(rects):
+    array = np.empty((len(rects), 4), dtype=np.float64)
+    for i, rect in enumerate(rects):
+        array[i] = (rect.left, rect.top, rect.right - 1, rect.bottom - 1)
+    return array
+
+
+# Tests segments from starts to ends, both of shape (..., 2), against every
+# rect of a (rects, 4) array and returns a (..., rects) hit matrix. rects may
+# also have leading dimensions which broadcast against those of the segments.
+# Endpoints are truncated to integers as pygame.Rect.clipline does.
+def segments_hit_rects(starts, ends, rects):
+    starts = np.trunc(np.asarray(starts, dtype=np.float64))[..., None, :]
+    ends = np.trunc(np.asarray(ends, dtype=np.float64))[..., None, :]
+    lows = rects[..., 0:2]
+    highs = rects[..., 2:4]
+    delta = ends - starts
+
+    # Parametric entry and exit of the segment through each axis slab
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_low = (lows - starts) / delta
+        t_high = (highs - starts) / delta
+    parallel = delta == 0
+    inside = (starts >= lows) & (starts <= highs)
+    t_enter = np.where(parallel, np.where(inside, 0, np.inf),
+                       np.minimum(t_low, t_high))
+    t_exit = np.where(parallel, np.where(inside, 1, -np.inf),
+                      np.maximum(t_low, t_high))
+
+    t_enter = np.maximum(t_enter.max(axis=-1), 0)
+    t_exit = np.minimum(t_exit.min(axis=-1), 1)
+    return (t_enter <= t_exit) & (highs[..., 0] >= lows[..., 0]) & \
+        (highs[..., 1] >= lows[..., 1])
+
+
+# Tests every beam of every car, from origins of shape (cars, 2) to endpoints
+# of shape (cars, beams, 2), and returns a (cars, beams) matrix which is True
+# where the beam hits any rect. rects is either shared, of shape (rects, 4),
+# or per beam, of shape (cars, beams, rects, 4) (see broadphase.Grid_Index).
+def beam_hits(origins, endpoints, rects):
+    if rects.shape[-2] == 0:
+        return np.zeros(np.shape(endpoints)[:-1], dtype=bool)
+    origins = np.broadcast_to(np.asarray(origins)[:, None, :],
+                              np.shape(endpoints))
+    return segments_hit_rects(origins, endpoints, rects).any(axis=-1)
+
+
+# Returns the 4 edges of every car body, given corners of shape (cars, 4, 2)
+# in order around the car, as (cars, 4, 2) starts and ends
+def body_edges(corners):
+    corners = np.asarray(corners)
+    return corners, np.roll(corners, -1, axis=1)
+
+
+# Returns the segments of every car body swept from its old to its new
+# corners, as (cars, 9, 2) starts and ends: the 4 edges at the new corners,
+# the paths of the 4 corners and the long axis at the new corners. Grid
+# candidates of these cover every rect inside the new body as well, for
+# swept_body_hits.
+def swept_body_edges(old_corners, corners):
+    starts, ends = body_edges(corners)
+    axis_starts = (corners[:, 0:1] + corners[:, 1:2]) / 2
+    axis_ends = (corners[:, 2:3] + corners[:, 3:4]) / 2
+    return (np.concatenate((starts, old_corners, axis_starts), axis=1),
+            np.concatenate((ends, corners, axis_ends), axis=1))
+
+
+# Returns True where points of shape (cars, ..., 2) are inside the body of
+# their car, given corners of shape (cars, 4, 2) in order around the car
+def points_in_bodies(points, corners):
+    corners = np.asarray(corners)
+    corners = corners.reshape((len(corners),) + (1,) * (np.ndim(points) - 2) +
+                              corners.shape[1:])
+    edges = np.roll(corners, -1, axis=-2) - corners
+    offsets = np.asarray(points)[..., None, :] - corners
+    cross = edges[..., 0] * offsets[..., 1] - edges[..., 1] * offsets[..., 0]
+    return (cross >= 0).all(axis=-1) | (cross <= 0).all(axis=-1)
+
+
+# Tests segments of shape (cars, segments, 2), such as body edges, against
+# rects, either shared or per segment of shape (cars, segments, rects, 4),
+# and returns a (cars,) array which is True where any segment of the car
+# hits any rect
+def edges_hit(starts, ends, rects):
+    if rects.shape[-2] == 0:
+        return np.zeros(len(starts), dtype=bool)
+    return segments_hit_rects(starts, ends, rects).any(axis=(1, 2))
+
+
+# Tests the edges of every car body against rects, either shared or per edge
+# of shape (cars, 4, rects, 4), and returns a (cars,) array which is True
+# where the car hits any rect. Batched equivalent of Car.collide_rect.
+def body_hits(corners, rects):
+    starts, ends = body_edges(corners)
+    return edges_hit(starts, ends, rects)
+
+
+# Tests the segments of bodies swept to new corners, from swept_body_edges,
+# against rects, either shared or per segment of shape (cars, 9, rects, 4),
+# and returns a (cars,) array which is True where the car hits any rect.
+# Walls crossed in one step are hit by a corner path or an edge, and rects
+# small enough to be passed over entirely end up inside the new body, as
+# long as a step is shorter than the car.
+def swept_body_hits(starts, ends, corners, rects):
+    hits = edges_hit(starts, ends, rects)
+    if rects.shape[-2] == 0:
+        return hits
+    if rects.ndim == 2:
+        rects = rects[None]
+    # Padding rects are empty and never inside
+    inside = (points_in_bodies(rects[..., 0:2], corners) &
+              (rects[..., 2] >= rects[..., 0]))
+    return hits | inside.reshape(len(corners), -1).any(axis=1)
@@ -0,0 +1,98 @@
+"""
+    Command traces: the commands of every car on every frame of a
+    generation, stored compactly for replay (see replay.py).
+    Car.apply_command only checks thresholds, so each command is quantized
+    to -1, 0 or 1 and both commands of a car fit in 4 bits.
+"""
+
+import os
+import numpy as np
+from checkpoint import write_arrays
+
+TRACE_VERSION = 1
+
+
+# Quantizes commands the way Car.apply_command reads them, to -1, 0 or 1
+def quantize_commands(commands):
+    commands = np.asarray(commands)
+    return ((commands > 0.5).astype(np.int8) -
+            (commands < -0.5).astype(np.int8))
+
+
+# Encodes (cars,) command arrays as one 0-8 code per car
+def encode_commands(forward, turn_left):
+    return ((quantize_commands(forward) + 1) * 3 +
+            quantize_commands(turn_left) + 1).astype(np.uint8)
+
+
+def decode_commands(codes):
+    codes = np.asarray(codes, dtype=np.int8)
+    return (codes // 3 - 1).astype(np.float64), \
+        (codes % 3 - 1).astype(np.float64)
+
+
+# Packs (frames, cars) codes two cars to a byte
+def pack_codes(codes):
+    if codes.shape[1] % 2:
+        codes = np.pad(codes, ((0, 0), (0, 1)))
+    return codes[:, 0::2] | (codes[:, 1::2] << 4)
+
+
+def unpack_codes(packed, cars):
+    codes = np.empty((len(packed), packed.shape[1] * 2), dtype=np.uint8)
+    codes[:, 0::2] = packed & 0x0f
+    codes[:, 1::2] = packed >> 4
+    return codes[:, :cars]
+
+
+class Command_Recorder():
+
+    # Collects the commands of every car on each step of a generation, for
+    # a Simulation given it as recorder. Only generations simulated in
+    # process are recorded, not shards simulated by workers.
+
+    def __init__(self):
+        self.frames = []
+
+    def start_gen(self):
+        self.frames = []
+
+    def record(self, forward, turn_left):
+        self.frames.append(encode_commands(forward, turn_left))
+
+    # Saves the commands of the concluded generation of sim, with what is
+    # needed to rebuild it: level files, settings and the scores of the cars
+    def save(self, path, sim):
+        level_paths = [level.path for level in sim.levels.levels]
+        assert None not in level_paths, "Only levels from files can be traced"
+        codes = np.array(self.frames, dtype=np.uint8).reshape(
+            len(self.frames), sim.car_count)
+        write_arrays(path, {
+            "version": np.array(TRACE_VERSION),
+            "level_paths": np.array(level_paths),
+            "gen_number": np.array(sim.gen_number),
+            "gen_size": np.array(sim.gen_size),
+            "gen_frames": np.array(sim.gen_frames),
+            "stall_frames": np.array(-1 if sim.stall_frames is None
+                                     else sim.stall_frames),
+            "dt": np.array(sim.dt),
+            "raster": np.array(sim.raster is not None),
+            "commands": pack_codes(codes),
+            "car_scores": sim.car_scores,
+        })
+
+    # Saves to gen_<number>.trace.npz in directory
+    def save_gen(self, directory, sim):
+        os.makedirs(directory, exist_ok=True)
+        self.save(os.path.join(directory, "gen_" + str(sim.gen_number).zfill(4)
+                               + ".trace.npz"), sim)
+
+
+def load_trace(path):
+    with np.load(path) as trace:
+        trace = {name: trace[name] for name in trace.files}
+    assert int(trace["version"]) == TRACE_VERSION, \
+        "Unsupported trace version"
+    trace["commands"] = unpack_codes(
+        trace["commands"], int(trace["gen_size"]) * len(trace["level_paths"]))
+    return trace
@@ -4,13 +4,41 @@
 
 import pygame
 import random
-from abc import ABC, abstractmethod
+import copyreg
+from abc import ABC, ABCMeta, abstractmethod
 from objects import Car, LiDAR_Car
 from ann import FC_NNLayer
+from genetics import generation_rng, select_parents, breed
 import math
+import numpy as np
+
+# Classes made by Evolvable_Driver.variant(), by base class and attributes
+variant_classes = {}
+
+
+class Driver_Variant_Meta(ABCMeta):
+
+    # Metaclass of Evolvable_Driver.variant() classes. They can't be found by
+    # name, so they are pickled (e.g. for worker processes) as their base
+    # class and attributes, and rebuilt by variant() on the other side.
+
+    pass
+
+
+def make_variant(base, attributes):
+    return base.variant(**attributes)
+
+
+copyreg.pickle(Driver_Variant_Meta, lambda cls: (
+    make_variant, (cls.__bases__[0], cls.variant_attributes)))
 
 
 class Driver(ABC):
+
+    # Frames between the decisions of a driver. A Simulation repeats the
+    # last command in between, without running the driver.
+    decision_interval = 1
+
     def __init__(self, car):
         self.car = car
         self.win = 0
@@ -19,6 +47,13 @@ class Driver(ABC):
     def drive_command(self):
         pass
 
+    # Drivers which support batched inference return their stacked
+    # parameters here, to be passed to batch_drive_command. Others return None
+    # and are driven one at a time through drive_command.
+    @classmethod
+    def stack_drivers(cls, drivers):
+        return None
+
 
 class Player_Driver(Driver):
     def drive_command(self):
@@ -37,6 +72,19 @@ class Player_Driver(Driver):
         return forward, turn_left
 
 
+class Command_Driver(Driver):
+
+    # Drives with commands set from outside, e.g. by an environment passing
+    # them straight to Simulation.step()
+
+    def __init__(self, car):
+        super().__init__(car)
+        self.command = (0, 0)
+
+    def drive_command(self):
+        return self.command
+
+
 class Random_Driver(Driver):
     def drive_command(self):
         forward = random.uniform(-1, 1)
@@ -66,22 +114,106 @@ class Momentum_Driver(Driver):
 
 
 class Evolvable_Driver(Driver):
+
+    # Names of the FC_NNLayer attributes which make up the genome
+    layer_names = ()
+    # (min, max) noise added to one random weight of each layer of a child
+    mutation_ranges = ()
+
+    # A child of two parents, bred like one child of breed()
     @classmethod
     def mate(cls, parent_1, parent_2, car):
         assert (parent_1.__class__ == parent_2.__class__
                 ), "Only drivers of the same class can mate"
+        genomes = np.array([parent_1.genome(), parent_2.genome()])
+        child = breed(generation_rng(), genomes, [0], [1],
+                      parent_1.mutation_segments())[0]
+        return cls.from_genome(child, car)
+
+    # Breeds one child for each car from random pairs of different parents.
+    # Every gene is taken from either parent evenly, then one weight of each
+    # layer is mutated. The whole generation is bred as one genome array,
+    # which backs the layers of the children.
+    @classmethod
+    def breed(cls, parents, cars, rng=None):
+        assert len(parents) > 1, "At least 2 parents required for evolution"
+        if rng is None:
+            rng = generation_rng()
+        genomes = np.array([parent.genome() for parent in parents])
+        i_p1, i_p2 = select_parents(rng, len(parents), len(cars))
+        children = breed(rng, genomes, i_p1, i_p2,
+                         parents[0].mutation_segments())
+        return [cls.from_genome(genome, car)
+                for genome, car in zip(children, cars)]
+
+    # Returns the weights and biases of every layer as one flat array
+    def genome(self):
+        parts = []
+        for name in self.layer_names:
+            layer = getattr(self, name)
+            parts.append(np.ravel(layer.weights))
+            parts.append(np.ravel(layer.biases))
+        return np.concatenate(parts).astype(np.float64)
+
+    # Returns the (offset, size, min, max) genome segment of each layer's
+    # weights, for genetics.mutate
+    def mutation_segments(self):
+        segments = []
+        offset = 0
+        for name, (min, max) in zip(self.layer_names, self.mutation_ranges):
+            layer = getattr(self, name)
+            size = layer.output_dim * layer.input_dim
+            segments.append((offset, size, min, max))
+            offset += size + layer.output_dim
+        return segments
+
+    # Returns a subclass with other class attributes, e.g. mutation_ranges,
+    # under the same name. Equal variants are the same class.
+    @classmethod
+    def variant(cls, **attributes):
+        key = (cls, tuple(sorted(attributes.items())))
+        if key not in variant_classes:
+            namespace = dict(attributes, __module__=cls.__module__,
+                             __qualname__=cls.__qualname__,
+                             variant_attributes=attributes)
+            variant_classes[key] = Driver_Variant_Meta(
+                cls.__name__, (cls,), namespace)
+        return variant_classes[key]
+
+    # Creates a driver with the layers stored in a genome from genome(). The
+    # layers are views of the genome array, not copies.
+    @classmethod
+    def from_genome(cls, genome, car):
+        driver = cls(car, randomize=False)
+        genome = np.asarray(genome, dtype=np.float64)
+        offset = 0
+        for name in cls.layer_names:
+            layer = getattr(driver, name)
+            size = layer.output_dim * layer.input_dim
+            layer.weights = genome[offset:offset + size].reshape(
+                (layer.output_dim, layer.input_dim))
+            offset += size
+            layer.biases = genome[offset:offset + layer.output_dim]
+            offset += layer.output_dim
+        assert offset == len(genome), "Genome does not fit driver layers"
+        return driver
 
 
 class No_Hidden_NN_Driver(Evolvable_Driver):
-    def __init__(self, car):
+
+    layer_names = ("io_layer",)
+    mutation_ranges = ((-0.5, 0.5),)
+
+    def __init__(self, car, randomize=True):
         super().__init__(car)
 
         # Input to output layer
-        #   In: 3 LiDAR beams (2 distances per angle reduced to 1 feature)
+        #   In: 3 LiDAR beams (3 distances per angle reduced to 1 feature)
         #       + Car speed
         #   Out: Forward, Turn Left
         self.io_layer = FC_NNLayer(4, 2)
-        self.io_layer.randomize_weights_biases(-2, 2)
+        if randomize:
+            self.io_layer.randomize_weights_biases(-2, 2)
 
     def drive_command(self):
         if type(self.car) is LiDAR_Car:
@@ -89,7 +221,7 @@ class No_Hidden_NN_Driver(Evolvable_Driver):
             for i in range(int(math.floor(len(self.car.beam_collided)/3))):
                 if self.car.beam_collided[3*i + 2]:
                     input.append(1)
-                if self.car.beam_collided[3*i + 1]:
+                elif self.car.beam_collided[3*i + 1]:
                     input.append(0.6)
                 elif self.car.beam_collided[3*i]:
                     input.append(0.3)
@@ -102,32 +234,55 @@ class No_Hidden_NN_Driver(Evolvable_Driver):
             return 0, 0
 
     @classmethod
-    def mate(cls, parent_1, parent_2, car):
-        super().mate(parent_1, parent_2, car)
-        child = cls(car)
-        # Choose random genetics from self and partner (i.e. weights),
-        # evenly weighing both parents
-        child.io_layer = FC_NNLayer.mix_layers(
-            parent_1.io_layer, parent_2.io_layer, 0.5)
-        child.io_layer.mutate_layer(-0.5, 0.5)
-        return child
+    def stack_drivers(cls, drivers):
+        return [FC_NNLayer.stack_layers([d.io_layer for d in drivers])]
+
+    # Batched drive_command for LiDAR cars, given (cars, beams) collided flags
+    # and car speeds. indices selects the stacked drivers to run, in the same
+    # order as the rows of beam_collided and speed.
+    @classmethod
+    def batch_drive_command(cls, stacked, beam_collided, speed, max_speed,
+                            indices=None):
+        (io_weights, io_biases), = stacked
+        if indices is not None:
+            io_weights, io_biases = io_weights[indices], io_biases[indices]
+
+        # Same features as drive_command: one per group of 3 beams, from
+        # the shortest beam which collided, then speed
+        beam_collided = np.asarray(beam_collided, dtype=bool)
+        groups = beam_collided.shape[1] // 3
+        input = np.where(
+            beam_collided[:, 2:3*groups:3], 1.0,
+            np.where(beam_collided[:, 1:3*groups:3], 0.6,
+                     np.where(beam_collided[:, 0:3*groups:3], 0.3, 0.0)))
+        input = np.column_stack((input, np.asarray(speed) / max_speed))
+
+        output = FC_NNLayer.batch_forward(io_weights, io_biases, input)
+        return output[:, 0], output[:, 1]
 
 
 class One_Hidden_NN_Driver(Evolvable_Driver):
-    def __init__(self, car):
+
+    layer_names = ("ih_layer", "ho_layer")
+    mutation_ranges = ((-2, 2), (-0.5, 0.5))
+    hidden_width = 4
+
+    def __init__(self, car, randomize=True):
         super().__init__(car)
 
         # Input to hidden layer
-        #   In: 3 LiDAR beams + Car speed
-        #   Out: 4 Hidden
-        self.ih_layer = FC_NNLayer(4, 4)
-        self.ih_layer.randomize_weights_biases(-2, 2)
+        #   In: 4 pairs of LiDAR beams (1 feature per pair) + Car speed
+        #   Out: hidden_width Hidden
+        self.ih_layer = FC_NNLayer(5, self.hidden_width)
 
         # Hidden to output layer
-        #   In: 4 Hidden
+        #   In: hidden_width Hidden
         #   Out: Forward, Turn Left
-        self.ho_layer = FC_NNLayer(4, 2)
-        self.ho_layer.randomize_weights_biases(-2, 2)
+        self.ho_layer = FC_NNLayer(self.hidden_width, 2)
+
+        if randomize:
+            self.ih_layer.randomize_weights_biases(-2, 2)
+            self.ho_layer.randomize_weights_biases(-2, 2)
 
     def drive_command(self):
         if type(self.car) is LiDAR_Car:
@@ -147,15 +302,28 @@ class One_Hidden_NN_Driver(Evolvable_Driver):
             return 0, 0
 
     @classmethod
-    def mate(cls, parent_1, parent_2, car):
-        super().mate(parent_1, parent_2, car)
-        child = cls(car)
-        # Choose random genetics from self and partner (i.e. weights),
-        # evenly weighing both parents
-        child.ih_layer = FC_NNLayer.mix_layers(
-            parent_1.ih_layer, parent_2.ih_layer, 0.5)
-        child.ih_layer.mutate_layer(-2, 2)
-        child.ho_layer = FC_NNLayer.mix_layers(
-            parent_1.ho_layer, parent_2.ho_layer, 0.5)
-        child.ho_layer.mutate_layer(-0.5, 0.5)
-        return child
+    def stack_drivers(cls, drivers):
+        return [FC_NNLayer.stack_layers([d.ih_layer for d in drivers]),
+                FC_NNLayer.stack_layers([d.ho_layer for d in drivers])]
+
+    # Batched drive_command for LiDAR cars, given (cars, beams) collided flags
+    # and car speeds. indices selects the stacked drivers to run, in the same
+    # order as the rows of beam_collided and speed.
+    @classmethod
+    def batch_drive_command(cls, stacked, beam_collided, speed, max_speed,
+                            indices=None):
+        (ih_weights, ih_biases), (ho_weights, ho_biases) = stacked
+        if indices is not None:
+            ih_weights, ih_biases = ih_weights[indices], ih_biases[indices]
+            ho_weights, ho_biases = ho_weights[indices], ho_biases[indices]
+
+        # Same features as drive_command: one per pair of beams, then speed
+        beam_collided = np.asarray(beam_collided, dtype=bool)
+        pairs = beam_collided.shape[1] // 2
+        input = np.where(beam_collided[:, 1:2*pairs:2], 1.0,
+                         np.where(beam_collided[:, 0:2*pairs:2], 0.5, 0.0))
+        input = np.column_stack((input, speed))
+
+        hidden = FC_NNLayer.batch_forward(ih_weights, ih_biases, input)
+        output = FC_NNLayer.batch_forward(ho_weights, ho_biases, hidden)
+        return output[:, 0], output[:, 1]
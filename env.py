@@ -0,0 +1,78 @@
+"""
+    Gym-style vectorized racing environment.
+    Steps a batch of cars with actions from outside code (e.g. RL or
+    evolution strategies) and returns batched observations, rewards and done
+    flags. Nothing is drawn, so no display is needed.
+"""
+
+import numpy as np
+from drivers import Command_Driver
+from level import Level, Level_Set, load_level, load_levels
+from simulation import Simulation, GEN_SIZE, GEN_FRAMES
+
+
+class Vector_Racing_Env():
+
+    # num_envs cars on each given level (a level JSON path, a list of them,
+    # a Level or a Level_Set), simulated as one batch by a Simulation.
+    #
+    # Actions are (cars, 2) arrays of forward and turn_left commands, see
+    # Car.apply_command. Observations are (cars, beams + 1) arrays of the
+    # LiDAR beam collided flags and the speed as a fraction of max speed.
+    # An episode ends for a car when it wins, crashes or stalls (with
+    # stall_frames) and for every car after max_frames frames; finished cars
+    # ignore their actions until reset(). Each step simulates dt frames with
+    # the same action (see Simulation).
+    #
+    # Rewards are the change in the score conclude_gen would give each car,
+    # so the rewards of an episode add up to that score: distance from start
+    # while driving, then the win or crash score when finished.
+
+    def __init__(self, levels="levels/turn.json", num_envs=GEN_SIZE,
+                 max_frames=GEN_FRAMES, stall_frames=None, raster=None,
+                 dt=1):
+        if isinstance(levels, str):
+            levels = load_level(levels)
+        elif not isinstance(levels, (Level, Level_Set)):
+            levels = load_levels(levels)
+        self.sim = Simulation(levels, driver_class=Command_Driver,
+                              gen_size=num_envs, gen_frames=max_frames,
+                              raster=raster, stall_frames=stall_frames,
+                              dt=dt)
+        self.num_envs = self.sim.car_count
+        self.observation_size = self.sim.population.beam_collided.shape[1] + 1
+        self.action_size = 2
+        self.scores = np.zeros(self.num_envs)
+
+    def observe(self):
+        pop = self.sim.population
+        return np.column_stack((pop.beam_collided.astype(np.float64),
+                                pop.speed / pop.max_speed))
+
+    # Starts a new episode for every car and returns the first observations
+    def reset(self):
+        self.sim.start_gen()
+        self.scores = self.sim.current_scores()
+        return self.observe()
+
+    # Returns observations, rewards, done flags and an info dict
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.float64)
+        self.sim.step((actions[:, 0], actions[:, 1]))
+
+        scores = self.sim.current_scores()
+        rewards = scores - self.scores
+        self.scores = scores
+        if self.sim.gen_cur_frame >= self.sim.gen_frames:
+            done = np.ones(self.num_envs, dtype=bool)
+        else:
+            done = self.sim.car_finished.copy()
+        info = {"frame": self.sim.gen_cur_frame, "scores": scores}
+        return self.observe(), rewards, done, info
+
+    def close(self):
+        self.sim.close()
+
+
+# Name used by gym-style code
+VectorRacingEnv = Vector_Racing_Env
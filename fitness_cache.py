@@ -0,0 +1,60 @@
+"""
+    Memoized fitness of genomes.
+    Cars start from a fixed position and NN drivers are deterministic, so a
+    genome driven on a level with the same settings always scores the same.
+"""
+
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+FITNESS_CACHE_SIZE = 100000
+
+# How a car's generation ended, cached with its score
+OUTCOME_RUNNING = 0
+OUTCOME_WON = 1
+OUTCOME_CRASHED = 2
+OUTCOME_STALLED = 3
+
+
+def genome_key(genome):
+    return hashlib.blake2b(np.ascontiguousarray(genome, dtype=np.float64)
+                           .tobytes(), digest_size=16).digest()
+
+
+# Returns a key for a level simulated with the given settings (e.g. frames
+# per generation), covering everything besides the genome a score depends on
+def level_key(level, settings):
+    key = hashlib.blake2b(digest_size=16)
+    key.update(repr((level.start_x, level.start_y, level.start_angle,
+                     settings)).encode())
+    key.update(np.ascontiguousarray(level.goal_rects).tobytes())
+    key.update(np.ascontiguousarray(level.crash_rects).tobytes())
+    return key.digest()
+
+
+class Fitness_Cache():
+
+    # (score, outcome) of (genome key, level key) pairs, holding at most
+    # max_size entries and evicting the least recently used
+
+    def __init__(self, max_size=FITNESS_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, score, outcome):
+        self.entries[key] = (float(score), int(outcome))
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
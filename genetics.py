@@ -0,0 +1,48 @@
+"""
+    Batched genetic operators over flat genomes, one row per driver.
+    A whole generation of children is bred with one parent draw, one
+    crossover mask draw and one mutation noise draw.
+"""
+
+import random
+import numpy as np
+
+
+# Returns a numpy generator seeded from the random module, so evolution stays
+# reproducible from random.seed() and resumable from its checkpointed state
+def generation_rng():
+    return np.random.default_rng(random.getrandbits(64))
+
+
+# Chooses two different parents among the first selection_count for each of
+# size children
+def select_parents(rng, selection_count, size):
+    i_p1 = rng.integers(0, selection_count, size)
+    i_p2 = (i_p1 + rng.integers(1, selection_count, size)) % selection_count
+    return i_p1, i_p2
+
+
+# Takes each gene from genomes_1 with probability weighting_1, otherwise from
+# genomes_2
+def crossover(rng, genomes_1, genomes_2, weighting_1=0.5):
+    mask = rng.random(genomes_1.shape) < weighting_1
+    return np.where(mask, genomes_1, genomes_2)
+
+
+# Adds uniform noise to one random gene of each segment of every genome, in
+# place. segments holds an (offset, size, min, max) tuple per segment.
+def mutate(rng, genomes, segments):
+    offsets, sizes, mins, maxs = (np.array(column) for column in
+                                  zip(*segments))
+    draws = rng.random((2, len(genomes), len(segments)))
+    positions = offsets + (draws[0] * sizes).astype(np.intp)
+    noise = mins + draws[1] * (maxs - mins)
+    genomes[np.arange(len(genomes))[:, None], positions] += noise
+    return genomes
+
+
+# Breeds children genomes from (parents, genes) genomes, pairing
+# genomes[i_p1[c]] with genomes[i_p2[c]] for child c
+def breed(rng, genomes, i_p1, i_p2, segments, weighting_1=0.5):
+    children = crossover(rng, genomes[i_p1], genomes[i_p2], weighting_1)
+    return mutate(rng, children, segments)
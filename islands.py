@@ -0,0 +1,285 @@
+"""
+    Island-model evolution: several populations evolve on their own, in
+    separate processes or on separate machines, and every few generations
+    send copies of their best genomes to the next island of a ring.
+    Run directly to start the islands as local processes, or one island with
+    --listen and --send-to to join islands running elsewhere.
+"""
+
+import io
+import os
+import queue
+import random
+import threading
+from multiprocessing import Process, AuthenticationError
+from multiprocessing.connection import Listener, Client
+import numpy as np
+from level import load_level, load_levels
+from raster import load_raster
+from fitness_cache import Fitness_Cache
+from simulation import Simulation, build_parser, check_args
+
+ISLANDS = 2
+ISLAND_HOST = "localhost"
+ISLAND_PORT = 6100
+# Environment variable holding the key shared by all islands of a run,
+# checked when they connect, unless --authkey is given
+ISLAND_AUTHKEY_VARIABLE = "ISLAND_AUTHKEY"
+MIGRANTS = 3
+MIGRATION_INTERVAL = 5
+
+
+# Encodes the best count drivers of a concluded generation as .npz bytes.
+# Migrants are plain arrays, so they are read without unpickling anything.
+def encode_migrants(island, sim, count):
+    buffer = io.BytesIO()
+    np.savez(buffer, island=np.array(island),
+             gen_number=np.array(sim.gen_number),
+             driver_class=np.array(sim.driver_class.__name__),
+             genomes=np.array([driver.genome()
+                               for driver in sim.drivers[:count]]),
+             scores=np.array(sim.driver_scores[:count], dtype=np.float64))
+    return buffer.getvalue()
+
+
+def decode_migrants(data):
+    with np.load(io.BytesIO(data), allow_pickle=False) as migrants:
+        return {name: migrants[name] for name in migrants.files}
+
+
+# Replaces the worst drivers of a concluded generation with migrants and
+# ranks them all again by score, so the next generation is bred from the
+# migrants which beat the island's own parents
+def immigrate(sim, genomes, scores):
+    count = min(len(genomes), sim.gen_size)
+    for i, genome in zip(range(sim.gen_size - count, sim.gen_size), genomes):
+        sim.drivers[i] = sim.driver_class.from_genome(genome.copy(),
+                                                      sim.cars[i])
+    sim.driver_scores = np.concatenate((sim.driver_scores[:-count],
+                                        scores[:count]))
+    order = np.argsort(-sim.driver_scores, kind="stable")
+    sim.driver_scores = sim.driver_scores[order]
+    sim.drivers = [sim.drivers[i] for i in order]
+
+
+# Parses "host:port" into a connection address
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+class Island():
+
+    # One population of a Simulation, listening for migrants at listen and
+    # sending its own to the island listening at send_to. Every
+    # migration_interval generations, copies of its best migrants drivers
+    # are sent; after every generation, the migrants which arrived since the
+    # last one take the places of its worst drivers. Only islands sharing
+    # authkey (bytes) connect, and migrants of another driver class or
+    # genome length are dropped.
+    #
+    # Migrants are sent and received on background threads, so islands never
+    # wait for each other. Migrants for an island which isn't listening (yet,
+    # or any more) are dropped, as is a batch still waiting to be sent when
+    # a newer one is ready.
+
+    def __init__(self, sim, index, listen, send_to, authkey,
+                 migrants=MIGRANTS, migration_interval=MIGRATION_INTERVAL):
+        self.sim = sim
+        self.index = index
+        self.send_to = send_to
+        self.migrants = migrants
+        self.migration_interval = migration_interval
+        self.authkey = authkey
+        self.connection = None
+        self.sent = 0
+        self.received = 0
+
+        self.arrived = queue.Queue()
+        self.listener = Listener(listen, authkey=authkey)
+        self.accept_thread = threading.Thread(target=self._accept_loop,
+                                              daemon=True)
+        self.accept_thread.start()
+        self.outbox = queue.Queue(maxsize=1)
+        self.send_thread = threading.Thread(target=self._send_loop,
+                                            daemon=True)
+        self.send_thread.start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except AuthenticationError:
+                continue
+            except OSError:
+                # Listener closed
+                return
+            threading.Thread(target=self._receive_loop, args=(connection,),
+                             daemon=True).start()
+
+    def _receive_loop(self, connection):
+        with connection:
+            while True:
+                try:
+                    data = connection.recv_bytes()
+                except (EOFError, OSError):
+                    return
+                self.arrived.put(decode_migrants(data))
+
+    def _send_loop(self):
+        while True:
+            data = self.outbox.get()
+            if data is None:
+                return
+            try:
+                if self.connection is None:
+                    self.connection = Client(self.send_to,
+                                             authkey=self.authkey)
+                self.connection.send_bytes(data)
+                self.sent += 1
+            except (OSError, AuthenticationError):
+                # Not listening, try again with the next migrants
+                self.connection = None
+
+    # Queues copies of the best drivers to be sent, replacing migrants which
+    # haven't been sent yet
+    def emigrate(self):
+        try:
+            self.outbox.get_nowait()
+        except queue.Empty:
+            pass
+        self.outbox.put(encode_migrants(self.index, self.sim, self.migrants))
+
+    # Takes in the migrants which have arrived, returning how many
+    def take_arrived(self):
+        count = 0
+        genome_length = len(self.sim.drivers[0].genome())
+        while True:
+            try:
+                migrants = self.arrived.get_nowait()
+            except queue.Empty:
+                return count
+            if str(migrants["driver_class"]) != self.sim.driver_class.__name__:
+                continue
+            genomes = migrants["genomes"]
+            if genomes.ndim != 2 or genomes.shape[1] != genome_length:
+                continue
+            immigrate(self.sim, migrants["genomes"], migrants["scores"])
+            count += len(migrants["genomes"])
+            self.received += len(migrants["genomes"])
+
+    def on_gen_end(self, sim):
+        if sim.gen_number % self.migration_interval == 0:
+            self.emigrate()
+        arrived = self.take_arrived()
+        print("Island " + str(self.index) + " generation " +
+              str(sim.gen_number) + ": " + " ".join(sim.summary_lines()) +
+              (" Migrants: " + str(arrived) if arrived else ""), flush=True)
+
+    def run(self, generations):
+        self.sim.run(generations, on_gen_end=self.on_gen_end)
+
+    # Sends the last migrants still waiting and stops listening
+    def close(self):
+        self.outbox.put(None)
+        self.send_thread.join()
+        if self.connection is not None:
+            self.connection.close()
+        self.listener.close()
+        self.sim.close()
+
+
+def parse_args(args=None):
+    parser = build_parser("Evolve several populations of drivers as islands "
+                          "which exchange their best drivers.")
+    parser.add_argument("--islands", type=int, default=ISLANDS,
+                        help="number of islands to start as local processes")
+    parser.add_argument("--port", type=int, default=ISLAND_PORT,
+                        help="port of the first local island, the others "
+                        "listen on the following ports")
+    parser.add_argument("--island", type=int, default=0,
+                        help="index of the island started with --listen")
+    parser.add_argument("--listen", default=None,
+                        help="host:port to receive migrants on, to run one "
+                        "island of islands on several machines")
+    parser.add_argument("--send-to", default=None,
+                        help="host:port of the island to send migrants to, "
+                        "with --listen")
+    parser.add_argument("--migrants", type=int, default=MIGRANTS,
+                        help="best drivers sent to the next island")
+    parser.add_argument("--migration-interval", type=int,
+                        default=MIGRATION_INTERVAL,
+                        help="generations between sending migrants")
+    parser.add_argument("--authkey",
+                        default=os.environ.get(ISLAND_AUTHKEY_VARIABLE),
+                        help="key shared by all islands, required with "
+                        "--listen (default: the " + ISLAND_AUTHKEY_VARIABLE +
+                        " environment variable, or a random key for local "
+                        "processes)")
+    args = parser.parse_args(args)
+    check_args(parser, args)
+    if (args.checkpoint is not None or args.resume is not None or
+            args.record_dir is not None or args.profile_trace is not None or
+            args.telemetry is not None):
+        parser.error("islands don't support checkpoints, traces, profile "
+                     "traces or telemetry")
+    if (args.listen is None) != (args.send_to is None):
+        parser.error("--listen and --send-to must be given together")
+    if args.listen is not None and not args.authkey:
+        parser.error("--listen needs --authkey or " + ISLAND_AUTHKEY_VARIABLE)
+    return args
+
+
+# Runs one island with the simulation settings of args
+def run_island(args, index, listen, send_to, authkey):
+    if args.seed is not None:
+        random.seed(args.seed + index)
+    if args.levels is not None:
+        level = load_levels(args.levels)
+    else:
+        level = load_level(args.level)
+    sim = Simulation(level, gen_size=args.gen_size,
+                     gen_frames=args.gen_frames, workers=args.workers,
+                     stall_frames=args.stall_frames,
+                     raster=load_raster(level) if args.raster else None,
+                     aggregate=args.aggregate, elites=args.elites,
+                     fitness_cache=Fitness_Cache() if args.fitness_cache
+                     else None, dt=args.dt,
+                     decision_interval=args.decision_interval)
+    island = Island(sim, index, listen, send_to, authkey, args.migrants,
+                    args.migration_interval)
+    try:
+        island.run(args.generations)
+    finally:
+        island.close()
+    print("Island " + str(index) + " sent " + str(island.sent) +
+          " batches and received " + str(island.received) + " migrants",
+          flush=True)
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.listen is not None:
+        run_island(args, args.island, parse_address(args.listen),
+                   parse_address(args.send_to), args.authkey.encode())
+        return
+
+    # A ring of local processes, island i sending to island i + 1. Without a
+    # given key, they share a new one which no other run can know.
+    if args.authkey:
+        authkey = args.authkey.encode()
+    else:
+        authkey = os.urandom(32)
+    addresses = [(ISLAND_HOST, args.port + i) for i in range(args.islands)]
+    processes = [Process(target=run_island,
+                         args=(args, i, addresses[i],
+                               addresses[(i + 1) % args.islands], authkey))
+                 for i in range(args.islands)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+    Level geometry and loading from level JSON files.
+"""
+
+import pygame
+import json
+import math
+import numpy as np
+from collision import rects_to_array
+from broadphase import Grid_Index, Multi_Level_Index
+
+SCREEN_HEIGHT = 800
+SCREEN_WIDTH = 1400
+
+BORDER_WIDTH = 50
+BORDER_RECTS = []
+BORDER_RECTS.append(pygame.Rect(0, 0, SCREEN_WIDTH, BORDER_WIDTH))
+BORDER_RECTS.append(pygame.Rect(0, SCREEN_HEIGHT -
+                    BORDER_WIDTH, SCREEN_WIDTH, BORDER_WIDTH))
+BORDER_RECTS.append(pygame.Rect(0, 0, BORDER_WIDTH, SCREEN_HEIGHT))
+BORDER_RECTS.append(pygame.Rect(SCREEN_WIDTH - BORDER_WIDTH,
+                    0, BORDER_WIDTH, SCREEN_HEIGHT))
+
+MAX_HYPOT = math.hypot(SCREEN_HEIGHT - (BORDER_WIDTH * 2),
+                       SCREEN_WIDTH - (BORDER_WIDTH * 2))
+
+# Horizontal distance between the levels of a Level_Set
+LEVEL_SPACING = SCREEN_WIDTH + BORDER_WIDTH
+
+
+class Level():
+
+    # Static level geometry: car start pose, goal and obstacle rects. Goals
+    # and crash rects (obstacles and borders) are also kept as arrays with a
+    # spatial index for batched collision tests.
+
+    def __init__(self, start_x, start_y, start_angle, goals, obstacles,
+                 path=None):
+        self.path = path
+        self.start_x = start_x
+        self.start_y = start_y
+        self.start_angle = start_angle
+        self.goals = goals
+        self.obstacles = obstacles
+        self.borders = BORDER_RECTS
+
+        self.goal_rects = rects_to_array(goals)
+        self.crash_rects = rects_to_array(obstacles + self.borders)
+        self.goal_index = Grid_Index(self.goal_rects)
+        self.crash_index = Grid_Index(self.crash_rects)
+
+
+class Level_Set():
+
+    # Several levels laid out side by side, level k shifted right by
+    # k * LEVEL_SPACING pixels, so cars on every level can be simulated and
+    # collision tested as one batch. Shifts are whole pixels, so collisions
+    # are the same as on the unshifted level. The first level is not
+    # shifted.
+
+    def __init__(self, levels):
+        self.levels = list(levels)
+        self.offsets = np.arange(len(self.levels)) * LEVEL_SPACING
+        self.start_x = np.array([level.start_x for level in self.levels],
+                                dtype=np.float64) + self.offsets
+        self.start_y = np.array([level.start_y for level in self.levels],
+                                dtype=np.float64)
+        self.start_angle = np.array(
+            [level.start_angle for level in self.levels], dtype=np.float64)
+
+        self.goal_index = Multi_Level_Index(self._shifted_rects("goal_rects"))
+        self.crash_index = Multi_Level_Index(
+            self._shifted_rects("crash_rects"))
+
+    def __len__(self):
+        return len(self.levels)
+
+    def _shifted_rects(self, name):
+        return [getattr(level, name) + (offset, 0, offset, 0)
+                for level, offset in zip(self.levels, self.offsets)]
+
+
+def load_level(path):
+    with open(path) as level_f:
+        level = json.loads(level_f.read())
+
+    goals = []
+    obstacles = []
+    if "goals" in level.keys():
+        for level_goal in level["goals"]:
+            goals.append(pygame.Rect(
+                level_goal["left"], level_goal["top"], level_goal["width"], level_goal["height"]))
+    if "obstacles" in level.keys():
+        for level_obst in level["obstacles"]:
+            obstacles.append(pygame.Rect(
+                level_obst["left"], level_obst["top"], level_obst["width"], level_obst["height"]))
+
+    return Level(level["start"]["x"], level["start"]["y"],
+                 level["start"]["angle"], goals, obstacles, path=path)
+
+
+def load_levels(paths):
+    return Level_Set([load_level(path) for path in paths])
@@ -4,29 +4,21 @@
 """
 
 import pygame
-import json
+import argparse
+import numpy as np
 from objects import *
 from drivers import *
+from level import *
+from simulation import Simulation, AGGREGATES, DEFAULT_AGGREGATE
+from render import Renderer, Sprite_Cache
+from profiling import Phase_Profiler
+from command_trace import Command_Recorder
+from telemetry import Telemetry_Writer
+from checkpoint import (Checkpoint_Writer, load_checkpoint,
+                        checkpoint_drivers, restore_checkpoint)
+
+MAX_SIM_PER_FRAME = 64
 
-pygame.init()
-SCREEN_HEIGHT = 800
-SCREEN_WIDTH = 1400
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-clock = pygame.time.Clock()
-running = True
-recognised_last_gen = True
-hold_gen_pause_count = 9
-
-BORDER_WIDTH = 50
-BORDER_RECTS = []
-BORDER_RECTS.append(pygame.Rect(0, 0, SCREEN_WIDTH, BORDER_WIDTH))
-BORDER_RECTS.append(pygame.Rect(0, SCREEN_HEIGHT -
-                    BORDER_WIDTH, SCREEN_WIDTH, BORDER_WIDTH))
-BORDER_RECTS.append(pygame.Rect(0, 0, BORDER_WIDTH, SCREEN_HEIGHT))
-BORDER_RECTS.append(pygame.Rect(SCREEN_WIDTH - BORDER_WIDTH,
-                    0, BORDER_WIDTH, SCREEN_HEIGHT))
-
-FONT = pygame.font.SysFont(None, 24)
 LINE_HEIGHT = 20
 
 MSGBOX_WIDTH = 300
@@ -37,224 +29,251 @@ MSGBOX_RECT = pygame.Rect((SCREEN_WIDTH / 2) - (MSGBOX_WIDTH / 2),
 MSGBOX_TEXT_PADDING = 15
 
 
-def msgbox_show_text(text_lines):
-    global screen, FONT
-
-    pygame.draw.rect(screen, "#FBBA00", MSGBOX_RECT)
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description="Watch drivers train on a level.")
+    parser.add_argument("--level", default="levels/turn.json",
+                        help="level JSON file to load")
+    parser.add_argument("--levels", nargs="+", default=None,
+                        help="train on all of these level JSON files at "
+                        "once, showing the first")
+    parser.add_argument("--aggregate", choices=AGGREGATES,
+                        default=DEFAULT_AGGREGATE,
+                        help="how scores over several levels are combined")
+    parser.add_argument("--pause-every", type=int, default=10,
+                        help="generations to run before pausing for r")
+    parser.add_argument("--stall-frames", type=int, default=None,
+                        help="finish drivers which make no progress for this "
+                        "many frames")
+    parser.add_argument("--dt", type=int, default=1,
+                        help="frames simulated per step, with collisions "
+                        "swept between steps")
+    parser.add_argument("--decision-interval", type=int, default=None,
+                        help="frames between driver decisions, repeating "
+                        "the last command in between")
+    parser.add_argument("--sim-per-frame", type=int, default=1,
+                        help="simulation ticks per displayed frame, "
+                        "changed at runtime with + and -")
+    parser.add_argument("--top-k", type=int, default=0,
+                        help="only draw the K cars with the most progress "
+                        "(0 draws all)")
+    parser.add_argument("--hide-beams", action="store_true",
+                        help="don't draw LiDAR beams, toggled at runtime "
+                        "with b")
+    parser.add_argument("--elites", type=int, default=0,
+                        help="carry this many of the best drivers over "
+                        "unchanged to the next generation")
+    parser.add_argument("--checkpoint", default=None,
+                        help="save the population here after every "
+                        "generation")
+    parser.add_argument("--archive", default=None,
+                        help="keep the best genome of every generation here")
+    parser.add_argument("--resume", default=None,
+                        help="continue from this checkpoint")
+    parser.add_argument("--record-dir", default=None,
+                        help="save a command trace of every generation in "
+                        "this directory, for replay.py")
+    parser.add_argument("--profile", action="store_true",
+                        help="time each phase of the loop and show rolling "
+                        "averages")
+    parser.add_argument("--profile-trace", default=None,
+                        help="also write a row of phase times per generation "
+                        "to this .csv or .jsonl file")
+    parser.add_argument("--telemetry", default=None,
+                        help="append statistics of every generation to this "
+                        ".jsonl or .sqlite file, see telemetry.py")
+    return parser.parse_args(args)
+
+
+def msgbox_show_text(renderer, font, text_lines):
+    renderer.mark_dirty(pygame.draw.rect(renderer.screen, "#FBBA00",
+                                         MSGBOX_RECT))
 
     line_level = MSGBOX_RECT.y + MSGBOX_TEXT_PADDING
     for line in text_lines:
-        screen.blit(FONT.render(line, False, "#000000"),
-                    (MSGBOX_RECT.x + MSGBOX_TEXT_PADDING,
-                    line_level))
+        renderer.screen.blit(font.render(line, False, "#000000"),
+                             (MSGBOX_RECT.x + MSGBOX_TEXT_PADDING,
+                              line_level))
         line_level += LINE_HEIGHT
 
 
-# Default car position
-start_x = 0
-start_y = 0
-start_angle = 0
-goals = []
-obstacles = []
-# Load level
-with open("levels/turn.json") as level_f:
-    level = json.loads(level_f.read())
-    start_x = level["start"]["x"]
-    start_y = level["start"]["y"]
-    start_angle = level["start"]["angle"]
-    if "goals" in level.keys():
-        for level_goal in level["goals"]:
-            goals.append(pygame.Rect(
-                level_goal["left"], level_goal["top"], level_goal["width"], level_goal["height"]))
-    if "obstacles" in level.keys():
-        for level_obst in level["obstacles"]:
-            obstacles.append(pygame.Rect(
-                level_obst["left"], level_obst["top"], level_obst["width"], level_obst["height"]))
-
-GEN_SIZE = 60
-GEN_FRAMES = 800
-gen_number = 1
-gen_cur_frame = 0
-gen_win_count = 0
-gen_crash_count = 0
-SELECTION_RATIO = 0.3
-SELECTION_COUNT = int(math.floor(GEN_SIZE * SELECTION_RATIO))
-cars = [LiDAR_Car(start_x, start_y, start_angle) for _ in range(GEN_SIZE)]
-drivers = [One_Hidden_NN_Driver(car) for car in cars]
-MAX_HYPOT = math.hypot(SCREEN_HEIGHT - (BORDER_WIDTH * 2),
-                       SCREEN_WIDTH - (BORDER_WIDTH * 2))
-driver_scores = [0] * GEN_SIZE
-driver_finished = [False] * GEN_SIZE
-
-
-def reset_car(car):
-    car.force_position(start_x, start_y, start_angle)
-
-
-def draw_static_objects():
-    global goals, obstacles, BORDER_RECTS
-    for goal in goals:
-        pygame.draw.rect(screen, "#93F651", goal)
-    for obst in obstacles:
-        pygame.draw.rect(screen, "#F27549", obst)
-    for border_rect in BORDER_RECTS:
-        pygame.draw.rect(screen, "#111111", border_rect)
-
-
-def handle_goal_collisions(car, goals):
-    collided = False
-    for goal in goals:
-        if (car.collide_rect(goal)):
-            collided = True
-    return collided
-
-
-def handle_crash_collisions(car, obstacles, BORDER_RECTS):
-    collided = False
-    for obst in obstacles:
-        if (car.collide_rect(obst)):
-            collided = True
-        if type(car) is LiDAR_Car:
-            car.beam_collide_rect_register(obst)
-
-    for border_rect in BORDER_RECTS:
-        if (car.collide_rect(border_rect)):
-            collided = True
-        if type(car) is LiDAR_Car:
-            car.beam_collide_rect_register(border_rect)
-    return collided
-
-
-def drive_and_draw_cars():
-    global screen, cars, drivers, driver_scores, driver_finished
-    global gen_win_count, gen_crash_count
-
-    for i in range(len(cars)):
-
-        if driver_finished[i]:
+# Indices of the cars on the shown (first) level to draw: all of them, or the
+# top K by progress. Finished cars keep their crash or win score, which
+# isn't comparable to the distance of driving cars, so they are only picked
+# when fewer than K cars are still driving.
+def cars_to_draw(sim, top_k):
+    if top_k <= 0 or top_k >= sim.gen_size:
+        return range(sim.gen_size)
+    scores = sim.current_scores()[:sim.gen_size]
+    finished = sim.car_finished[:sim.gen_size]
+    # Driving cars first, each group by score, best first
+    order = np.lexsort((-scores, finished))
+    return order[:top_k].tolist()
+
+
+def drive_and_draw_cars(sim, renderer, sim_per_frame, top_k, draw_beams,
+                        profiler=None):
+    # Advance several simulation ticks per displayed frame
+    for _ in range(sim_per_frame):
+        if sim.gen_over():
+            break
+        sim.step()
+
+    if profiler is not None:
+        t = profiler.clock()
+    drawn = cars_to_draw(sim, top_k)
+    sim.sync_cars(drawn)
+
+    for i in drawn:
+        if sim.car_finished[i]:
             continue
 
-        # Controls
-        forward, turn_left = drivers[i].drive_command()
-        cars[i].apply_command(forward, turn_left)
-
-        # Update Car Position
-        cars[i].simulate_friction()
-        cars[i].position_frame_update()
-
-        # Handle Collisions (including LiDAR beams)
-        if handle_goal_collisions(cars[i], goals):
-            # Reward win and short time to goal
-            driver_scores[i] = (
-                100 + (((GEN_FRAMES - gen_cur_frame) / GEN_FRAMES) * 100))
-            driver_finished[i] = True
-            gen_win_count += 1
-
-        if handle_crash_collisions(cars[i], obstacles, BORDER_RECTS):
-            # Reward survival time
-            driver_scores[i] = (gen_cur_frame / GEN_FRAMES) * 100
-            driver_finished[i] = True
-            gen_crash_count += 1
-
         # Draw car on top
-        cars[i].draw(screen)
+        renderer.draw_car(sim.cars[i])
 
         # Draw LiDAR Beams
-        if type(cars[i]) is LiDAR_Car:
-            cars[i].draw_beams(screen)
-
-
-def conclude_gen():
-    global screen, drivers, driver_scores, driver_finished
-
-    # Calculate scores for non-collided drivers
-    for i in range(len(driver_scores)):
-        if driver_finished[i]:
-            continue
-        # Reward distance from
-        driver_scores[i] = (math.hypot(
-            cars[i].x - start_x, cars[i].y - start_y) / MAX_HYPOT)
-
-    # Sort drivers by score
-    combined = list(zip(driver_scores, drivers))
-    combined.sort(reverse=True, key=lambda x: x[0])
-    # Unpack
-    driver_scores, drivers = zip(*combined)
-
-    msgbox_show_text(["Press r for next 10 generations",
-                      "Win Rate: " + str((gen_win_count/GEN_SIZE) * 100) + "%",
-                      "Top Scores: ",
-                      "1st: " + str(driver_scores[0]),
-                      "2nd: " + str(driver_scores[1]),
-                      "3rd: " + str(driver_scores[2])])
-
-
-def evolve_drivers():
-    global drivers
-
-    assert SELECTION_COUNT > 1, "At least 2 parents required for evolution"
-    child_drivers = []
-    for i in range(GEN_SIZE):
-        # Choose two random, different parents and create child
-        i_p1 = random.randint(0, SELECTION_COUNT - 1)
-        i_p2 = int((i_p1 + random.randint(1, SELECTION_COUNT - 1)) %
-                   SELECTION_COUNT)
-        child_drivers.append(drivers[0].__class__.mate(
-            drivers[i_p1], drivers[i_p2], cars[i]))
-
-    drivers = child_drivers
-
-
-# Main Game Loop
-while running:
-
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_r:
-                # Poll for resume
-                hold_gen_pause_count = 10
-
-    if hold_gen_pause_count > 0 and not recognised_last_gen:
-        # Do next gen
-        gen_number += 1
-        gen_cur_frame = 0
-        driver_scores = [0] * GEN_SIZE
-        driver_finished = [False] * GEN_SIZE
-        gen_win_count = 0
-        gen_crash_count = 0
-        for car in cars:
-            reset_car(car)
-        evolve_drivers()
-        hold_gen_pause_count -= 1
-        recognised_last_gen = True
-
-    if recognised_last_gen:
-        # Clears screen of last frame
-        screen.fill("#eeeeee")
-
-        draw_static_objects()
-
-        drive_and_draw_cars()
-
-        gen_cur_frame += 1
-        if (gen_cur_frame >= GEN_FRAMES):
-            conclude_gen()
-            recognised_last_gen = False
-
-        # Text
-        screen.blit(FONT.render("Generation: " + str(gen_number) +
-                                " Frame: " + str(gen_cur_frame),
-                                False, "#ffffff"), (50, 20))
-        screen.blit(FONT.render("Win/Crash/Total: " + str(gen_win_count) +
-                                "/" + str(gen_crash_count) +
-                                "/" + str(GEN_SIZE),
-                                False, "#ffffff"), (300, 20))
-
-        # Displays changes to screen
-        pygame.display.flip()
-
-    clock.tick(120)
-
-pygame.quit()
+        if draw_beams and type(sim.cars[i]) is LiDAR_Car:
+            renderer.draw_beams(sim.cars[i])
+
+    if profiler is not None:
+        profiler.lap("drawing", t)
+
+
+def main(args=None):
+    args = parse_args(args)
+
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    clock = pygame.time.Clock()
+    running = True
+    recognised_last_gen = True
+    hold_gen_pause_count = args.pause_every - 1
+    sim_per_frame = max(1, args.sim_per_frame)
+    draw_beams = not args.hide_beams
+
+    font = pygame.font.SysFont(None, 24)
+
+    # Load level
+    if args.levels is not None:
+        levels = load_levels(args.levels)
+        level = levels.levels[0]
+    else:
+        levels = level = load_level(args.level)
+    checkpoint = None
+    drivers = None
+    if args.resume is not None:
+        checkpoint = load_checkpoint(args.resume)
+        drivers = checkpoint_drivers(checkpoint)
+    profiler = None
+    if args.profile or args.profile_trace is not None:
+        profiler = Phase_Profiler(args.profile_trace)
+    recorder = None
+    if args.record_dir is not None:
+        recorder = Command_Recorder()
+    telemetry = None
+    if args.telemetry is not None:
+        telemetry = Telemetry_Writer(args.telemetry)
+    writer = None
+    if args.checkpoint is not None:
+        writer = Checkpoint_Writer(args.checkpoint, args.archive)
+    sim = Simulation(levels, drivers=drivers, stall_frames=args.stall_frames,
+                     profiler=profiler, aggregate=args.aggregate,
+                     recorder=recorder, elites=args.elites, dt=args.dt,
+                     decision_interval=args.decision_interval)
+    if checkpoint is not None:
+        # Breed the generation after the saved one, as simulation.py does
+        restore_checkpoint(sim, checkpoint)
+        sim.next_gen()
+    # Static objects are drawn once into the renderer's background
+    renderer = Renderer(screen, level,
+                        Sprite_Cache(car_image().convert_alpha()))
+
+    # Main Game Loop
+    while running:
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_r:
+                    # Poll for resume
+                    hold_gen_pause_count = args.pause_every
+                if event.key in (pygame.K_EQUALS, pygame.K_PLUS,
+                                 pygame.K_KP_PLUS):
+                    sim_per_frame = min(sim_per_frame * 2, MAX_SIM_PER_FRAME)
+                if event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    sim_per_frame = max(sim_per_frame // 2, 1)
+                if event.key == pygame.K_b:
+                    draw_beams = not draw_beams
+
+        if hold_gen_pause_count > 0 and not recognised_last_gen:
+            # Do next gen
+            sim.next_gen()
+            hold_gen_pause_count -= 1
+            recognised_last_gen = True
+
+        if recognised_last_gen:
+            # Clears last frame from screen
+            if profiler is not None:
+                t = profiler.clock()
+            renderer.begin_frame()
+            if profiler is not None:
+                profiler.lap("drawing", t)
+
+            drive_and_draw_cars(sim, renderer, sim_per_frame, args.top_k,
+                                draw_beams, profiler)
+
+            if sim.gen_over():
+                sim.conclude_gen()
+                if recorder is not None:
+                    recorder.save_gen(args.record_dir, sim)
+                if telemetry is not None:
+                    telemetry.record(sim)
+                if writer is not None:
+                    writer.save(sim)
+                msgbox_show_text(renderer, font,
+                                 ["Press r for next " +
+                                  str(args.pause_every) + " generations"] +
+                                 sim.summary_lines())
+                recognised_last_gen = False
+
+            # Text
+            renderer.draw_text(font.render("Generation: " +
+                                           str(sim.gen_number) +
+                                           " Frame: " + str(sim.gen_cur_frame),
+                                           False, "#ffffff"), (50, 20))
+            renderer.draw_text(font.render("Win/Crash/Total: " +
+                                           str(sim.gen_win_count) +
+                                           "/" + str(sim.gen_crash_count) +
+                                           "/" + str(sim.car_count),
+                                           False, "#ffffff"), (300, 20))
+            if sim.stall_frames is not None:
+                renderer.draw_text(font.render("Stalled: " +
+                                               str(sim.gen_stall_count),
+                                               False, "#ffffff"), (700, 20))
+            renderer.draw_text(font.render("Speed: " + str(sim_per_frame) +
+                                           "x", False, "#ffffff"), (550, 20))
+            if profiler is not None:
+                renderer.draw_text(font.render(profiler.hud_line(), False,
+                                               "#ffffff"), (50, 40))
+                t = profiler.clock()
+
+            # Displays changes to screen
+            renderer.end_frame()
+            if profiler is not None:
+                profiler.lap("drawing", t)
+                profiler.end_frame()
+
+        clock.tick(120)
+
+    if profiler is not None:
+        profiler.close()
+    if telemetry is not None:
+        telemetry.close()
+    if writer is not None:
+        writer.close()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
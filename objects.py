@@ -5,7 +5,20 @@
 import pygame
 import math
 
-CAR_IMAGE = pygame.image.load("assets/car.png")
+CAR_IMAGE_PATH = "assets/car.png"
+# Size of the car image, so cars can be simulated without loading it
+CAR_LENGTH = 64
+CAR_WIDTH = 32
+
+car_image_cache = None
+
+
+# Loads the car image on first use, for drawing
+def car_image():
+    global car_image_cache
+    if car_image_cache is None:
+        car_image_cache = pygame.image.load(CAR_IMAGE_PATH)
+    return car_image_cache
 
 
 class Car():
@@ -13,8 +26,6 @@ class Car():
     # Car object which encapsulates the physics of driving
 
     def __init__(self, x, y, angle):
-        self.image = CAR_IMAGE
-
         self.x = x
         self.y = y
         self.angle = angle
@@ -24,10 +35,9 @@ class Car():
         self.rotation_coefficient = 2
         self.acceleration = 0.05
         self.friction_deceleration = 0.02
-        # Get car dimensions
-        still_rect = self.image.get_rect()
-        self.length = still_rect.height
-        self.width = still_rect.width
+        # Car dimensions
+        self.length = CAR_LENGTH
+        self.width = CAR_WIDTH
         # Corner positions (for collision) - Nonsense Initialization
         # b = back, f = front, l = left, r = right
         self.corner_b_l = (x, y)
@@ -35,6 +45,10 @@ class Car():
         self.corner_f_r = (x, y)
         self.corner_f_l = (x, y)
 
+    @property
+    def image(self):
+        return car_image()
+
     def draw(self, screen):
         rotated_image = pygame.transform.rotate(
             self.image, self.angle)
@@ -0,0 +1,219 @@
+"""
+    Vectorized physics for whole populations of cars.
+    State is stored as NumPy arrays (struct of arrays) so that every live car
+    is advanced in one batched step, matching objects.Car within float
+    tolerance. A population may also advance several frames per step (dt).
+"""
+
+import numpy as np
+from objects import Car, LiDAR_Car
+
+
+class Car_Population():
+
+    # Batched equivalent of Car. Physics attributes are read from a template
+    # car so that both stay in sync. Every method takes an optional boolean
+    # mask selecting the cars to update (e.g. unfinished cars); by default
+    # all cars are updated.
+    #
+    # With dt > 1, each step applies dt frames of acceleration, turning,
+    # friction and movement at once. Cars then move up to dt * max_speed per
+    # step, so collisions should be swept between the old and new poses (see
+    # body_corners and collision.swept_body_edges).
+
+    car_class = Car
+
+    def __init__(self, size, x, y, angle, dt=1):
+        template = self.car_class(x, y, angle)
+        self.size = size
+        self.dt = dt
+
+        self.x = np.full(size, x, dtype=np.float64)
+        self.y = np.full(size, y, dtype=np.float64)
+        self.angle = np.full(size, angle, dtype=np.float64)
+        self.speed = np.zeros(size, dtype=np.float64)
+        # Per-frame physics attributes
+        self.max_speed = template.max_speed
+        self.rotation_coefficient = template.rotation_coefficient
+        self.acceleration = template.acceleration
+        self.friction_deceleration = template.friction_deceleration
+        # Car dimensions
+        self.length = template.length
+        self.width = template.width
+        # Corner positions (for collision), ordered as
+        # back left, back right, front right, front left
+        self.corners = np.empty((size, 4, 2), dtype=np.float64)
+        self.corners[:, :, 0] = x
+        self.corners[:, :, 1] = y
+
+    def _mask(self, mask):
+        if mask is None:
+            return np.ones(self.size, dtype=bool)
+        return np.asarray(mask, dtype=bool)
+
+    # Batched Car.apply_command, see Car for the command thresholds
+    def apply_command(self, forward, turn_left, mask=None):
+        mask = self._mask(mask)
+        forward = np.asarray(forward)
+        turn_left = np.asarray(turn_left)
+
+        accelerate = mask & (forward > 0.5) & (self.speed < self.max_speed)
+        self.speed[accelerate] += self.acceleration * self.dt
+        reverse = (mask & (forward < -0.5) &
+                   (self.speed > (-1 * self.max_speed)))
+        self.speed[reverse] -= self.acceleration * self.dt
+
+        turn = (self.rotation_coefficient * np.log(np.abs(self.speed) + 1) *
+                np.copysign(1, self.speed) * self.dt)
+        left = mask & (turn_left > 0.5)
+        right = mask & (turn_left < -0.5)
+        self.angle[left] += turn[left]
+        self.angle[right] -= turn[right]
+        turned = left | right
+        over = turned & (self.angle > 360)
+        under = turned & ~over & (self.angle < -360)
+        self.angle[over] -= 360
+        self.angle[under] += 360
+
+    def simulate_friction(self, mask=None):
+        mask = self._mask(mask)
+        deceleration = self.friction_deceleration * self.dt
+        stop = mask & (np.fabs(self.speed) < deceleration)
+        slow = mask & ~stop
+        self.speed[stop] = 0
+        self.speed[slow] -= np.sign(self.speed[slow]) * deceleration
+
+    def position_frame_update(self, mask=None):
+        mask = self._mask(mask)
+        radians = np.radians(self.angle[mask])
+        sin_theta = np.sin(radians)
+        cos_theta = np.cos(radians)
+
+        # Calculate new position
+        self.y[mask] += cos_theta * self.speed[mask] * self.dt
+        self.x[mask] += sin_theta * self.speed[mask] * self.dt
+
+        # Update Corners
+        self.corners[mask] = self._corners(self.x[mask], self.y[mask],
+                                           sin_theta, cos_theta)
+
+    # Returns the (cars, 4, 2) corners of the current poses of the masked
+    # cars, which corners only holds after a position update
+    def body_corners(self, mask=None):
+        mask = self._mask(mask)
+        radians = np.radians(self.angle[mask])
+        return self._corners(self.x[mask], self.y[mask], np.sin(radians),
+                             np.cos(radians))
+
+    def _corners(self, x, y, sin_theta, cos_theta):
+        half_width_sin_theta = (self.width / 2) * sin_theta
+        half_width_cos_theta = (self.width / 2) * cos_theta
+        half_length_sin_theta = (self.length / 2) * sin_theta
+        half_length_cos_theta = (self.length / 2) * cos_theta
+        corners = np.empty((len(x), 4, 2), dtype=np.float64)
+        corners[:, 0, 0] = x - half_length_sin_theta + half_width_cos_theta
+        corners[:, 0, 1] = y - half_length_cos_theta - half_width_sin_theta
+        corners[:, 1, 0] = x - half_length_sin_theta - half_width_cos_theta
+        corners[:, 1, 1] = y - half_length_cos_theta + half_width_sin_theta
+        corners[:, 2, 0] = x + half_length_sin_theta - half_width_cos_theta
+        corners[:, 2, 1] = y + half_length_cos_theta + half_width_sin_theta
+        corners[:, 3, 0] = x + half_length_sin_theta + half_width_cos_theta
+        corners[:, 3, 1] = y + half_length_cos_theta - half_width_sin_theta
+        return corners
+
+    def force_position(self, x, y, angle, speed=0, mask=None):
+        mask = self._mask(mask)
+        self.x[mask] = x
+        self.y[mask] = y
+        self.angle[mask] = angle
+        self.speed[mask] = speed
+
+    # Copies the state of car objects into the population
+    def load_cars(self, cars):
+        for i, car in enumerate(cars):
+            self.x[i] = car.x
+            self.y[i] = car.y
+            self.angle[i] = car.angle
+            self.speed[i] = car.speed
+            self.corners[i] = (car.corner_b_l, car.corner_b_r,
+                               car.corner_f_r, car.corner_f_l)
+
+    # Copies the state of the population into car objects (e.g. for drawing),
+    # optionally only those at the given indices
+    def store_cars(self, cars, indices=None):
+        if indices is None:
+            indices = range(len(cars))
+        for i in indices:
+            car = cars[i]
+            car.x = float(self.x[i])
+            car.y = float(self.y[i])
+            car.angle = float(self.angle[i])
+            car.speed = float(self.speed[i])
+            car.corner_b_l = tuple(self.corners[i, 0].tolist())
+            car.corner_b_r = tuple(self.corners[i, 1].tolist())
+            car.corner_f_r = tuple(self.corners[i, 2].tolist())
+            car.corner_f_l = tuple(self.corners[i, 3].tolist())
+
+
+class LiDAR_Car_Population(Car_Population):
+
+    # Batched equivalent of LiDAR_Car, with beam endpoints of shape
+    # (cars, beams, 2) and a (cars, beams) collided matrix.
+
+    car_class = LiDAR_Car
+
+    def __init__(self, size, x, y, angle, dt=1):
+        super().__init__(size, x, y, angle, dt)
+        template = self.car_class(x, y, angle)
+
+        self.beam_lengths = np.array(template.beam_lengths, dtype=np.float64)
+        self.beam_angles = np.array(template.beam_angles, dtype=np.float64)
+        # Beam endpoints (for collision) - Nonsense Initialization
+        self.beam_endpoints = np.empty(
+            (size, len(self.beam_angles), 2), dtype=np.float64)
+        self.beam_endpoints[:, :, 0] = x
+        self.beam_endpoints[:, :, 1] = y
+        self.beam_collided = np.zeros(
+            (size, len(self.beam_angles)), dtype=bool)
+
+    def position_frame_update(self, mask=None):
+        mask = self._mask(mask)
+        super().position_frame_update(mask)
+
+        # Calculate Beam Endpoints
+        radians = (np.radians(self.angle[mask])[:, None] +
+                   np.radians(self.beam_angles)[None, :])
+        endpoints = np.empty((len(radians), len(self.beam_angles), 2),
+                             dtype=np.float64)
+        endpoints[:, :, 0] = (self.x[mask][:, None] +
+                              np.sin(radians) * self.beam_lengths)
+        endpoints[:, :, 1] = (self.y[mask][:, None] +
+                              np.cos(radians) * self.beam_lengths)
+        self.beam_endpoints[mask] = endpoints
+
+        # Reset Beam Collided
+        self.beam_collided[mask] = False
+
+    def force_position(self, x, y, angle, speed=0, mask=None):
+        mask = self._mask(mask)
+        super().force_position(x, y, angle, speed, mask)
+
+        # Re-initialize Beam Endpoints so draw() doesn't go crazy
+        self.beam_endpoints[mask, :, 0] = self.x[mask][:, None]
+        self.beam_endpoints[mask, :, 1] = self.y[mask][:, None]
+
+    def load_cars(self, cars):
+        super().load_cars(cars)
+        for i, car in enumerate(cars):
+            self.beam_endpoints[i] = car.beam_endpoints
+            self.beam_collided[i] = car.beam_collided
+
+    def store_cars(self, cars, indices=None):
+        super().store_cars(cars, indices)
+        if indices is None:
+            indices = range(len(cars))
+        for i in indices:
+            car = cars[i]
+            car.beam_endpoints = [tuple(p) for p in
+                                  self.beam_endpoints[i].tolist()]
+            car.beam_collided = self.beam_collided[i].tolist()
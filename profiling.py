@@ -0,0 +1,88 @@
+"""
+    Per-phase timers for the simulation and live view.
+    Keeps rolling per-frame averages for the HUD and optionally streams one
+    row per generation to a CSV or JSONL trace file.
+"""
+
+import csv
+import json
+import time
+from collections import deque
+
+PHASES = ("inference", "physics", "collisions", "drawing", "evolution")
+PROFILE_WINDOW = 60
+
+
+class Phase_Profiler():
+
+    # Accumulates time spent in each phase. Timed code calls clock() once
+    # and then lap(phase, start) at the end of each phase, which adds the
+    # time since start to the phase and returns the time the next phase
+    # starts at. Code holding no profiler (None) skips timing altogether, so
+    # instrumentation costs one check per phase when turned off.
+    #
+    # end_frame() closes a displayed frame for the rolling averages and
+    # end_gen() closes a generation, writing its totals to the trace. A
+    # generation's row includes the evolution which bred it and everything
+    # timed until it concluded; "total" is the wall time since the last row.
+
+    def __init__(self, trace_path=None, window=PROFILE_WINDOW):
+        self.clock = time.perf_counter
+        self.frame = dict.fromkeys(PHASES, 0.0)
+        self.gen = dict.fromkeys(PHASES, 0.0)
+        self.frames = deque(maxlen=window)
+        self.gen_start = self.clock()
+
+        self.trace_path = trace_path
+        self.trace_file = None
+        self.trace_writer = None
+        if trace_path is not None:
+            self.trace_file = open(trace_path, "w", newline="")
+            if not trace_path.endswith(".jsonl"):
+                self.trace_writer = csv.writer(self.trace_file)
+                self.trace_writer.writerow(
+                    ("generation", "frames") + PHASES + ("total",))
+
+    def lap(self, phase, start):
+        now = self.clock()
+        self.frame[phase] += now - start
+        return now
+
+    def end_frame(self):
+        self.frames.append(self.frame)
+        for phase, seconds in self.frame.items():
+            self.gen[phase] += seconds
+        self.frame = dict.fromkeys(PHASES, 0.0)
+
+    # Rolling mean milliseconds per frame of each phase
+    def averages(self):
+        if len(self.frames) == 0:
+            return dict.fromkeys(PHASES, 0.0)
+        return {phase: 1000 * sum(frame[phase] for frame in self.frames) /
+                len(self.frames) for phase in PHASES}
+
+    def hud_line(self):
+        return " ".join(phase + ": " + format(ms, ".1f") + "ms"
+                        for phase, ms in self.averages().items())
+
+    def end_gen(self, sim):
+        # Include time of a frame still open, e.g. a headless generation
+        self.end_frame()
+        now = self.clock()
+        if self.trace_file is not None:
+            row = {"generation": sim.gen_number,
+                   "frames": sim.gen_frame_count()}
+            row.update(self.gen)
+            row["total"] = now - self.gen_start
+            if self.trace_writer is None:
+                self.trace_file.write(json.dumps(row) + "\n")
+            else:
+                self.trace_writer.writerow(row.values())
+            self.trace_file.flush()
+        self.gen = dict.fromkeys(PHASES, 0.0)
+        self.gen_start = now
+
+    def close(self):
+        if self.trace_file is not None:
+            self.trace_file.close()
+            self.trace_file = None
@@ -0,0 +1,155 @@
+"""
+    Level compiler: rasterizes a level's obstacles and borders into an
+    occupancy grid and signed distance field (SDF).
+    Compiled levels are cached next to the level file, keyed by a hash of
+    the geometry, and memory-mapped on load so worker processes share them.
+"""
+
+import hashlib
+import os
+import numpy as np
+from level import Level_Set, SCREEN_WIDTH, SCREEN_HEIGHT
+
+RASTER_CELL_SIZE = 2
+# Bump when the compiled format changes, to invalidate cached rasters
+RASTER_VERSION = 1
+
+
+class Level_Raster():
+
+    # Occupancy grid and SDF over the screen, one value per square cell.
+    # SDF values are the distance in pixels from the cell centre to the
+    # nearest wall, negative inside walls.
+
+    def __init__(self, sdf, occupancy, cell_size, paths=None):
+        self.sdf = sdf
+        self.occupancy = occupancy
+        self.cell_size = cell_size
+        # Cache files backing the arrays, if memory-mapped
+        self.paths = paths
+        # A point may be this far from the centre of its cell
+        self.half_diagonal = cell_size * np.sqrt(2) / 2
+
+    # Memory-mapped rasters are sent to worker processes as their cache
+    # paths, so every process maps the same file instead of copying it
+    def __getstate__(self):
+        if self.paths is None:
+            return self.__dict__
+        state = self.__dict__.copy()
+        del state["sdf"], state["occupancy"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "sdf" not in state:
+            self.sdf = np.load(self.paths[0], mmap_mode="r")
+            self.occupancy = np.load(self.paths[1], mmap_mode="r")
+
+    def _cells(self, points):
+        cells = np.floor(np.asarray(points) / self.cell_size).astype(np.intp)
+        cols = np.clip(cells[..., 0], 0, self.sdf.shape[1] - 1)
+        rows = np.clip(cells[..., 1], 0, self.sdf.shape[0] - 1)
+        return rows, cols
+
+    # Returns True where points of shape (..., 2) are inside a wall
+    def is_wall(self, points):
+        return self.occupancy[self._cells(points)].astype(bool)
+
+    def distance(self, points):
+        return self.sdf[self._cells(points)]
+
+    # Returns how far along each segment, from starts to ends of shape
+    # (..., 2), the first wall is, or the segment length if there is none.
+    # Sphere traces the SDF: each step is the distance to the nearest wall
+    # (less the cell error), but at least half a cell, so walls at least a
+    # cell thick are never stepped over.
+    def segment_distance(self, starts, ends):
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        lengths = np.hypot(*np.moveaxis(ends - starts, -1, 0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            directions = np.where(lengths[..., None] > 0,
+                                  (ends - starts) / lengths[..., None], 0)
+
+        t = np.zeros(lengths.shape)
+        hit = np.zeros(lengths.shape, dtype=bool)
+        active = np.ones(lengths.shape, dtype=bool)
+        while active.any():
+            t_active = t[active]
+            lengths_active = lengths[active]
+            d = self.distance(starts[active] +
+                              t_active[:, None] * directions[active])
+            hit_active = d <= 0
+            # The last step lands exactly on the end point
+            done = hit_active | (t_active >= lengths_active)
+            step = np.maximum(d - self.half_diagonal, self.cell_size / 2)
+            t[active] = np.where(done, t_active,
+                                 np.minimum(t_active + step, lengths_active))
+            hit[active] = hit_active
+            active[active] = ~done
+        return t, hit
+
+    # Returns True where segments hit a wall
+    def segment_hits(self, starts, ends):
+        return self.segment_distance(starts, ends)[1]
+
+
+# Computes the SDF of (rects, 4) rect arrays (see collision.rects_to_array)
+# at the cell centres of a grid covering the screen
+def rasterize(rects, cell_size=RASTER_CELL_SIZE):
+    cols = int(np.ceil(SCREEN_WIDTH / cell_size))
+    rows = int(np.ceil(SCREEN_HEIGHT / cell_size))
+    x = (np.arange(cols) + 0.5) * cell_size
+    y = (np.arange(rows) + 0.5)[:, None] * cell_size
+
+    sdf = np.full((rows, cols), np.inf, dtype=np.float32)
+    for left, top, right, bottom in rects:
+        # Rect arrays hold the last pixel inside, which extends one further
+        right += 1
+        bottom += 1
+        # Distance outside the rect, and depth inside it
+        dx = np.maximum(np.maximum(left - x, x - right), 0)
+        dy = np.maximum(np.maximum(top - y, y - bottom), 0)
+        outside = np.hypot(dx, dy)
+        depth = np.minimum(np.minimum(x - left, right - x),
+                           np.minimum(y - top, bottom - y))
+        np.minimum(sdf, np.where(outside > 0, outside, -depth), out=sdf)
+    return sdf
+
+
+def raster_key(level, cell_size=RASTER_CELL_SIZE):
+    key = hashlib.sha256()
+    key.update(np.ascontiguousarray(level.crash_rects).tobytes())
+    key.update(repr((cell_size, SCREEN_WIDTH, SCREEN_HEIGHT,
+                     RASTER_VERSION)).encode())
+    return key.hexdigest()[:16]
+
+
+def compile_level(level, cell_size=RASTER_CELL_SIZE):
+    sdf = rasterize(level.crash_rects, cell_size)
+    return Level_Raster(sdf, (sdf <= 0).astype(np.uint8), cell_size)
+
+
+# Returns the compiled raster of a level, loading it memory-mapped from the
+# cache next to the level file, and compiling and caching it on a miss.
+# Levels not loaded from a file are compiled in memory.
+def load_raster(level, cell_size=RASTER_CELL_SIZE):
+    assert not isinstance(level, Level_Set), \
+        "Rasters are only supported on a single level"
+    if level.path is None:
+        return compile_level(level, cell_size)
+
+    stem = os.path.splitext(level.path)[0] + "." + \
+        raster_key(level, cell_size)
+    paths = (stem + ".sdf.npy", stem + ".occupancy.npy")
+    if not all(os.path.exists(path) for path in paths):
+        raster = compile_level(level, cell_size)
+        # Write then rename, so concurrent loaders never map a partial file
+        for path, array in zip(paths, (raster.sdf, raster.occupancy)):
+            tmp_path = path + "." + str(os.getpid()) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+
+    return Level_Raster(np.load(paths[0], mmap_mode="r"),
+                        np.load(paths[1], mmap_mode="r"), cell_size, paths)
@@ -0,0 +1,123 @@
+"""
+    Rendering layer for the live view: cached car sprites, a pre-rendered
+    level background and dirty rect display updates.
+"""
+
+import pygame
+from collections import OrderedDict
+
+SPRITE_ANGLE_STEP = 2
+SPRITE_CACHE_SIZE = 90
+
+
+class Sprite_Cache():
+
+    # Rotated copies of an image, with angles quantized to angle_step
+    # degrees. Holds at most max_size sprites, evicting the least recently
+    # used.
+
+    def __init__(self, image, angle_step=SPRITE_ANGLE_STEP,
+                 max_size=SPRITE_CACHE_SIZE):
+        self.image = image
+        self.angle_step = angle_step
+        self.max_size = max_size
+        self.sprites = OrderedDict()
+
+    def get(self, angle):
+        key = int(round(angle / self.angle_step)) % \
+            int(round(360 / self.angle_step))
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = pygame.transform.rotate(self.image, key * self.angle_step)
+            self.sprites[key] = sprite
+            if len(self.sprites) > self.max_size:
+                self.sprites.popitem(last=False)
+        else:
+            self.sprites.move_to_end(key)
+        return sprite
+
+
+def render_background(level, size):
+    background = pygame.Surface(size)
+    background.fill("#eeeeee")
+    for goal in level.goals:
+        pygame.draw.rect(background, "#93F651", goal)
+    for obst in level.obstacles:
+        pygame.draw.rect(background, "#F27549", obst)
+    for border_rect in level.borders:
+        pygame.draw.rect(background, "#111111", border_rect)
+    return background
+
+
+class Renderer():
+
+    # Draws frames on top of a background rendered once per level. Only the
+    # areas drawn this frame or the last are restored and sent to the
+    # display, instead of clearing and flipping the whole screen. When those
+    # areas add up to more than the screen (e.g. many overlapping beams), the
+    # whole screen is redrawn as that is cheaper.
+
+    def __init__(self, screen, level, sprite_cache=None):
+        self.screen = screen
+        self.background = render_background(
+            level, screen.get_size()).convert(screen)
+        self.sprite_cache = sprite_cache
+        self.screen_area = screen.get_width() * screen.get_height()
+        self.last_dirty = []
+        self.dirty = []
+        self.full_redraw = True
+
+    def _dirty_area(self, rects):
+        return sum(rect.width * rect.height for rect in rects)
+
+    # Restores the background under everything drawn last frame
+    def begin_frame(self):
+        if self._dirty_area(self.last_dirty) > self.screen_area:
+            self.full_redraw = True
+        if self.full_redraw:
+            self.screen.blit(self.background, (0, 0))
+        else:
+            for rect in self.last_dirty:
+                self.screen.blit(self.background, rect, rect)
+        self.dirty = []
+
+    def mark_dirty(self, rect):
+        self.dirty.append(pygame.Rect(rect))
+
+    def end_frame(self):
+        if self.full_redraw or (self._dirty_area(self.dirty) >
+                                self.screen_area):
+            pygame.display.flip()
+            self.full_redraw = False
+        else:
+            pygame.display.update(self.last_dirty + self.dirty)
+        self.last_dirty = self.dirty
+
+    def draw_car(self, car):
+        if self.sprite_cache is None:
+            rotated_image = pygame.transform.rotate(car.image, car.angle)
+        else:
+            rotated_image = self.sprite_cache.get(car.angle)
+        new_rect = rotated_image.get_rect(center=(car.x, car.y))
+        self.screen.blit(rotated_image, new_rect.topleft)
+
+        corners = [car.corner_b_l, car.corner_b_r,
+                   car.corner_f_r, car.corner_f_l]
+        self.mark_dirty(new_rect.union(
+            pygame.draw.lines(self.screen, "#aaaaaa", True, corners, 2)))
+
+    def draw_beams(self, car):
+        beams_rect = None
+        for i in range(len(car.beam_endpoints)):
+            if (car.beam_collided[i]):
+                color = "#ee9999"
+            else:
+                color = "#99ee99"
+            rect = pygame.draw.line(self.screen, color, (car.x, car.y),
+                                    car.beam_endpoints[i], 2)
+            beams_rect = rect if beams_rect is None else beams_rect.union(rect)
+        if beams_rect is not None:
+            self.mark_dirty(beams_rect)
+
+    def draw_text(self, surface, pos):
+        self.mark_dirty(self.screen.blit(surface, pos))
@@ -0,0 +1,151 @@
+"""
+    Replays recorded command traces without running any driver.
+    Run directly to show or check a replay.
+"""
+
+import argparse
+import time
+import pygame
+import numpy as np
+from objects import car_image
+from drivers import Command_Driver
+from level import load_level, load_levels, SCREEN_WIDTH, SCREEN_HEIGHT
+from render import Renderer, Sprite_Cache
+from raster import load_raster
+from simulation import Simulation
+from command_trace import load_trace, decode_commands
+
+
+class Trace_Replay():
+
+    # Rebuilds a traced generation for the given drivers (default all) by
+    # stepping a simulation of Command_Drivers with the traced commands.
+    # Cars never interact, so any subset of drivers replays exactly as it
+    # ran. Cars of level k are again cars[k * gen_size:(k + 1) * gen_size]
+    # of the replay simulation, in the order of drivers. Collisions are
+    # checked the way the trace was recorded, exactly or on the level raster.
+
+    def __init__(self, trace, drivers=None):
+        gen_size = int(trace["gen_size"])
+        level_paths = [str(path) for path in trace["level_paths"]]
+        if drivers is None:
+            drivers = range(gen_size)
+        self.drivers = list(drivers)
+        self.columns = np.concatenate([np.asarray(self.drivers) + k * gen_size
+                                       for k in range(len(level_paths))])
+        self.commands = trace["commands"][:, self.columns]
+        self.traced_scores = trace["car_scores"][self.columns]
+
+        if len(level_paths) == 1:
+            levels = load_level(level_paths[0])
+        else:
+            levels = load_levels(level_paths)
+        stall_frames = int(trace["stall_frames"])
+        self.sim = Simulation(levels, driver_class=Command_Driver,
+                              gen_size=len(self.drivers),
+                              gen_frames=int(trace["gen_frames"]),
+                              stall_frames=None if stall_frames < 0
+                              else stall_frames, dt=int(trace["dt"]),
+                              raster=load_raster(levels)
+                              if bool(trace["raster"]) else None)
+        self.sim.gen_number = int(trace["gen_number"])
+
+    # Index of the next traced step
+    def step_index(self):
+        return self.sim.gen_cur_frame // self.sim.dt
+
+    def done(self):
+        return (self.sim.gen_over() or
+                self.step_index() >= len(self.commands))
+
+    def step(self):
+        self.sim.step(decode_commands(self.commands[self.step_index()]))
+
+    # Replays the rest of the generation and returns the car scores
+    def run(self):
+        while not self.done():
+            self.step()
+        return self.sim.current_scores()
+
+
+# Returns the drivers with the best mean traced score over the levels
+def best_drivers(trace, count):
+    scores = np.reshape(trace["car_scores"],
+                        (len(trace["level_paths"]), -1)).mean(axis=0)
+    return np.argsort(-scores, kind="stable")[:count].tolist()
+
+
+# Shows a replay with the live view's renderer
+def show_replay(replay, fps):
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    clock = pygame.time.Clock()
+    font = pygame.font.SysFont(None, 24)
+    renderer = Renderer(screen, replay.sim.levels.levels[0],
+                        Sprite_Cache(car_image().convert_alpha()))
+    shown = range(len(replay.drivers))
+
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+
+        renderer.begin_frame()
+        if not replay.done():
+            replay.step()
+        replay.sim.sync_cars(shown)
+        for i in shown:
+            renderer.draw_car(replay.sim.cars[i])
+            renderer.draw_beams(replay.sim.cars[i])
+        renderer.draw_text(font.render(
+            "Replay generation: " + str(replay.sim.gen_number) + " Frame: " +
+            str(replay.sim.gen_cur_frame), False, "#ffffff"), (50, 20))
+        renderer.end_frame()
+        clock.tick(fps)
+
+    pygame.quit()
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description="Replay a recorded command trace.")
+    parser.add_argument("trace", help="trace file to replay")
+    parser.add_argument("--drivers", nargs="+", type=int, default=None,
+                        help="indices of the drivers to replay")
+    parser.add_argument("--best", type=int, default=1,
+                        help="replay this many of the best drivers, unless "
+                        "--drivers is given")
+    parser.add_argument("--headless", action="store_true",
+                        help="replay without a display and print the scores")
+    parser.add_argument("--fps", type=int, default=60,
+                        help="frames per second of the shown replay")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    trace = load_trace(args.trace)
+    drivers = args.drivers
+    if drivers is None:
+        drivers = best_drivers(trace, args.best)
+    replay = Trace_Replay(trace, drivers)
+
+    if not args.headless:
+        show_replay(replay, args.fps)
+        return replay
+
+    start = time.perf_counter()
+    scores = replay.run()
+    seconds = time.perf_counter() - start
+    print("Replayed " + str(replay.sim.gen_cur_frame) + " frames of " +
+          str(len(replay.drivers)) + " drivers in " +
+          format(seconds, ".3f") + "s")
+    print("Scores: " + " ".join(format(score, ".3f") for score in scores))
+    print("Matches trace: " +
+          str(bool(np.allclose(scores, replay.traced_scores))))
+    return replay
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,674 @@
+"""
+    Headless simulation of driver generations.
+    Runs without a display, drawing or frame cap, so it can be used for
+    unattended training. Run directly for the command line entry point.
+"""
+
+import argparse
+import math
+import random
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from objects import LiDAR_Car
+from drivers import One_Hidden_NN_Driver
+from level import load_level, load_levels, Level_Set, MAX_HYPOT
+from physics import LiDAR_Car_Population
+from collision import (beam_hits, body_hits, body_edges, swept_body_edges,
+                       swept_body_hits)
+from raster import load_raster
+from profiling import Phase_Profiler
+from command_trace import Command_Recorder
+from telemetry import Telemetry_Writer
+from fitness_cache import (Fitness_Cache, genome_key, level_key, OUTCOME_WON,
+                           OUTCOME_CRASHED, OUTCOME_STALLED)
+from checkpoint import (Checkpoint_Writer, load_checkpoint,
+                        checkpoint_drivers, restore_checkpoint)
+
+GEN_SIZE = 60
+GEN_FRAMES = 800
+SELECTION_RATIO = 0.3
+# Ways of combining the scores of a driver over several levels
+AGGREGATES = ("mean", "min")
+DEFAULT_AGGREGATE = "mean"
+# Distance from start a car must gain to count as progress for stall_frames
+STALL_MIN_PROGRESS = 1.0
+
+
+class Simulation():
+
+    # A population of cars and drivers on one level. Each call to step()
+    # advances every unfinished car by one frame; a generation ends after
+    # gen_frames frames, or as soon as every driver has finished, after which
+    # drivers are scored and evolved. With stall_frames set, a driver which
+    # gets no further from the start for that many frames is finished early
+    # and scored like a driver still running at the end of the generation.
+    # Physics and collisions run batched on a LiDAR_Car_Population; the car
+    # objects of the drivers are only updated for drivers without batched
+    # inference, or on sync_cars() (e.g. before drawing).
+    #
+    # With workers > 1, run_gen() shards the drivers across a process pool
+    # instead (see evaluate_shard). Cars never interact and all randomness of
+    # evolution is drawn in this process, so for deterministic (NN) drivers
+    # the scores do not depend on the number of workers.
+    #
+    # Given a compiled Level_Raster, crash and LiDAR tests trace its distance
+    # field instead of testing the level rects.
+    #
+    # Given a Level_Set instead of a level, every driver drives one car on
+    # each of its levels, all simulated as one batch, and drivers are scored
+    # by the mean (or min, see aggregate) of their scores over the levels.
+    # Cars of level k are cars[k * gen_size:(k + 1) * gen_size].
+    #
+    # The best elites drivers of each generation are carried over unchanged
+    # into the next. Given a Fitness_Cache, cars whose genome already drove
+    # their level with the same settings (e.g. elites, or duplicate
+    # children) start the generation finished with their cached score, so
+    # they are not simulated again.
+    #
+    # Given a Command_Recorder (see command_trace.py), the commands of every
+    # car are recorded each frame.
+    #
+    # Given a Phase_Profiler, inference, physics, collisions and evolution
+    # are timed and each concluded generation is reported to it. Shards
+    # simulated by workers are not timed.
+    #
+    # With dt > 1, each step advances cars by dt frames (see
+    # LiDAR_Car_Population), so drivers are asked for commands, LiDAR is
+    # sensed and collisions are tested once every dt frames. Body collisions
+    # are then swept from the old to the new pose of each car so it can't
+    # jump over walls or goals. Frame counts (gen_frames, stall_frames,
+    # gen_cur_frame) stay in frames, not steps.
+    #
+    # Drivers decide every decision_interval frames (by default that of the
+    # driver class). Only cars with a decision due are driven, in one batch,
+    # and the others repeat their last command.
+
+    def __init__(self, level, driver_class=One_Hidden_NN_Driver,
+                 gen_size=GEN_SIZE, gen_frames=GEN_FRAMES,
+                 selection_ratio=SELECTION_RATIO, drivers=None, workers=1,
+                 raster=None, stall_frames=None, profiler=None,
+                 aggregate=DEFAULT_AGGREGATE, recorder=None, elites=0,
+                 fitness_cache=None, dt=1, decision_interval=None):
+        self.level = level
+        self.levels = level if isinstance(level, Level_Set) else \
+            Level_Set([level])
+        assert raster is None or len(self.levels) == 1, \
+            "Rasters are only supported on a single level"
+        assert aggregate in AGGREGATES, "Unknown aggregate " + str(aggregate)
+        self.aggregate = aggregate
+        self.profiler = profiler
+        self.recorder = recorder
+        self.raster = raster
+        self.stall_frames = stall_frames
+        self.gen_size = gen_size if drivers is None else len(drivers)
+        self.gen_frames = gen_frames
+        assert dt >= 1 and int(dt) == dt, "dt must be a whole number of frames"
+        self.dt = int(dt)
+        self.selection_count = int(math.floor(self.gen_size * selection_ratio))
+        assert 0 <= elites < self.gen_size, \
+            "Elites must leave room for at least one child"
+        self.elites = elites
+        self.workers = workers
+        self.pool = None
+
+        # One car per driver per level, level by level
+        self.car_count = self.gen_size * len(self.levels)
+        self.car_level = np.repeat(np.arange(len(self.levels)), self.gen_size)
+        self.car_driver = np.tile(np.arange(self.gen_size), len(self.levels))
+        self.start_x = self.levels.start_x[self.car_level]
+        self.start_y = self.levels.start_y[self.car_level]
+        self.start_angle = self.levels.start_angle[self.car_level]
+
+        self.cars = [LiDAR_Car(x, y, angle) for x, y, angle in zip(
+            self.start_x.tolist(), self.start_y.tolist(),
+            self.start_angle.tolist())]
+        # Moved to the start of each car's level by start_gen()
+        self.population = LiDAR_Car_Population(
+            self.car_count, self.start_x[0], self.start_y[0],
+            self.start_angle[0], self.dt)
+        # One driver per car of the first level. Its cars on the other
+        # levels only exist in the population.
+        if drivers is None:
+            self.drivers = [driver_class(car)
+                            for car in self.cars[:self.gen_size]]
+        else:
+            # Drive the given drivers with this simulation's cars
+            driver_class = drivers[0].__class__
+            self.drivers = list(drivers)
+            for driver, car in zip(self.drivers, self.cars):
+                driver.car = car
+        assert len(self.drivers) == self.gen_size, \
+            "Exactly one driver per car of a level"
+        self.driver_class = driver_class
+        if decision_interval is None:
+            decision_interval = driver_class.decision_interval
+        assert decision_interval >= 1, "Drivers must decide at least once"
+        self.decision_interval = decision_interval
+
+        self.fitness_cache = fitness_cache
+        # Cached cars are never driven, so they would be traced as parked
+        assert fitness_cache is None or recorder is None, \
+            "Generations using a fitness cache can't be recorded"
+        if fitness_cache is not None:
+            settings = (self.gen_frames, self.stall_frames,
+                        self.raster is not None, self.dt,
+                        self.decision_interval)
+            self.level_keys = [level_key(level, settings)
+                               for level in self.levels.levels]
+
+        self.gen_number = 1
+        self.start_gen()
+
+    def reset_car(self, i):
+        self.cars[i].force_position(float(self.start_x[i]),
+                                    float(self.start_y[i]),
+                                    float(self.start_angle[i]))
+
+    # Resets per-generation state without changing drivers
+    def start_gen(self):
+        self.gen_concluded = False
+        self.gen_cur_frame = 0
+        self.gen_win_count = 0
+        self.gen_crash_count = 0
+        self.gen_stall_count = 0
+        self.driver_scores = np.zeros(self.gen_size)
+        self.car_scores = np.zeros(self.car_count)
+        self.car_finished = np.zeros(self.car_count, dtype=bool)
+        # Furthest distance from start and the frame it was reached
+        self.car_progress = np.zeros(self.car_count)
+        self.car_progress_frame = np.zeros(self.car_count, dtype=np.intp)
+        self.car_outcome = np.zeros(self.car_count, dtype=np.int8)
+        # Frame each car started driving on, when cars don't all start
+        # together (see steady_state.py)
+        self.car_start_frame = np.zeros(self.car_count, dtype=np.intp)
+        self.car_cached = np.zeros(self.car_count, dtype=bool)
+        # Last commands of the drivers, repeated between decisions
+        self.car_forward = np.zeros(self.car_count)
+        self.car_turn_left = np.zeros(self.car_count)
+        for i in range(self.car_count):
+            self.reset_car(i)
+        self.population.force_position(self.start_x, self.start_y,
+                                       self.start_angle)
+        # Don't let the first commands see beams of the last generation
+        self.population.beam_collided[:] = False
+        # Drivers are fixed for the generation, so stack them once
+        self.driver_batch = self.driver_class.stack_drivers(self.drivers)
+        if self.recorder is not None:
+            self.recorder.start_gen()
+        if self.fitness_cache is not None:
+            self.load_cached_scores()
+
+    # Finishes the cars with a cached score for their genome and level
+    def load_cached_scores(self):
+        genome_keys = [genome_key(driver.genome()) for driver in self.drivers]
+        self.car_keys = [(genome_keys[self.car_driver[c]],
+                          self.level_keys[self.car_level[c]])
+                         for c in range(self.car_count)]
+        for c, key in enumerate(self.car_keys):
+            entry = self.fitness_cache.get(key)
+            if entry is not None:
+                self.car_scores[c], self.car_outcome[c] = entry
+                self.car_finished[c] = True
+                self.car_cached[c] = True
+        self.count_outcomes()
+
+    def count_outcomes(self):
+        self.gen_win_count = int((self.car_outcome == OUTCOME_WON).sum())
+        self.gen_crash_count = int((self.car_outcome == OUTCOME_CRASHED).sum())
+        self.gen_stall_count = int((self.car_outcome == OUTCOME_STALLED).sum())
+
+    # Caches the final scores of the cars simulated this generation
+    def cache_scores(self):
+        if self.fitness_cache is None:
+            return
+        for c in np.flatnonzero(~self.car_cached):
+            self.fitness_cache.put(self.car_keys[c], self.car_scores[c],
+                                   self.car_outcome[c])
+
+    def gen_over(self):
+        return (self.gen_cur_frame >= self.gen_frames or
+                bool(self.car_finished.all()))
+
+    # Frames simulated in the current generation
+    def gen_frame_count(self):
+        return self.gen_cur_frame
+
+    # Copies the population state into the car objects, optionally only
+    # those at the given indices
+    def sync_cars(self, indices=None):
+        self.population.store_cars(self.cars, indices)
+
+    # Returns forward and turn_left command arrays of the drivers of the
+    # given cars, computed in one batch when the driver class supports it
+    def drive_commands(self, indices):
+        if self.driver_batch is None:
+            assert len(self.levels) == 1, \
+                "Only batched drivers can drive several levels"
+            self.sync_cars()
+            commands = [self.drivers[i].drive_command() for i in indices]
+            return (np.array([c[0] for c in commands], dtype=np.float64),
+                    np.array([c[1] for c in commands], dtype=np.float64))
+
+        return self.driver_class.batch_drive_command(
+            self.driver_batch, self.population.beam_collided[indices],
+            self.population.speed[indices], self.population.max_speed,
+            self.car_driver[indices])
+
+    # Advances every unfinished car by dt frames, driven by its driver or by
+    # the given (forward, turn_left) command arrays of every car
+    def step(self, commands=None):
+        pop = self.population
+        prof = self.profiler
+        live = np.flatnonzero(~self.car_finished)
+        if len(live) > 0:
+            mask = ~self.car_finished
+            if prof is not None:
+                t = prof.clock()
+
+            # Controls
+            forward = self.car_forward
+            turn_left = self.car_turn_left
+            if commands is None:
+                # Cars with a decision due within this step
+                due = live[(self.gen_cur_frame - self.car_start_frame[live])
+                           % self.decision_interval < self.dt]
+                if len(due) > 0:
+                    forward[due], turn_left[due] = self.drive_commands(due)
+            else:
+                forward[live] = np.asarray(commands[0])[live]
+                turn_left[live] = np.asarray(commands[1])[live]
+            if self.recorder is not None:
+                self.recorder.record(forward, turn_left)
+            if prof is not None:
+                t = prof.lap("inference", t)
+            pop.apply_command(forward, turn_left, mask)
+            if self.dt > 1:
+                old_corners = pop.body_corners(mask)
+
+            # Update Car Position
+            pop.simulate_friction(mask)
+            pop.position_frame_update(mask)
+            if prof is not None:
+                t = prof.lap("physics", t)
+
+            # Handle Collisions (including LiDAR beams) against the rects
+            # near each body edge and beam
+            corners = pop.corners[live]
+            if self.dt > 1:
+                edge_starts, edge_ends = swept_body_edges(old_corners,
+                                                          corners)
+            else:
+                edge_starts, edge_ends = body_edges(corners)
+            origins = np.column_stack((pop.x[live], pop.y[live]))
+            endpoints = pop.beam_endpoints[live]
+
+            beam_starts = np.broadcast_to(origins[:, None, :],
+                                          endpoints.shape)
+            car_level = self.car_level[live]
+
+            won = self.body_hits(edge_starts, edge_ends, corners,
+                                 self.levels.goal_index.query_rects(
+                                     edge_starts, edge_ends, car_level))
+            if self.raster is None:
+                crashed = self.body_hits(
+                    edge_starts, edge_ends, corners,
+                    self.levels.crash_index.query_rects(
+                        edge_starts, edge_ends, car_level))
+                pop.beam_collided[live] |= beam_hits(
+                    origins, endpoints, self.levels.crash_index.query_rects(
+                        beam_starts, endpoints, car_level))
+            else:
+                crashed = self.raster.segment_hits(
+                    edge_starts, edge_ends).any(axis=1)
+                pop.beam_collided[live] |= self.raster.segment_hits(
+                    beam_starts, endpoints)
+            if prof is not None:
+                prof.lap("collisions", t)
+
+            # Reward win and short time to goal
+            frame = self.gen_cur_frame - self.car_start_frame[live]
+            self.car_scores[live[won]] = (
+                100 + (((self.gen_frames - frame[won]) /
+                        self.gen_frames) * 100))
+            self.car_outcome[live[won]] = OUTCOME_WON
+            self.gen_win_count += int(won.sum())
+            # Reward survival time
+            self.car_scores[live[crashed]] = (
+                frame[crashed] / self.gen_frames) * 100
+            self.car_outcome[live[crashed]] = OUTCOME_CRASHED
+            self.gen_crash_count += int(crashed.sum())
+            self.car_finished[live[won | crashed]] = True
+
+            if self.stall_frames is not None:
+                self.finish_stalled(live[~(won | crashed)])
+
+        self.gen_cur_frame += self.dt
+
+    # Tests car bodies, given their (swept with dt > 1) edges, against
+    # candidate rects
+    def body_hits(self, edge_starts, edge_ends, corners, rects):
+        if self.dt > 1:
+            return swept_body_hits(edge_starts, edge_ends, corners, rects)
+        return body_hits(corners, rects)
+
+    # Finishes the given drivers if they haven't made progress for
+    # stall_frames frames
+    def finish_stalled(self, indices):
+        distance = np.hypot(self.population.x[indices] - self.start_x[indices],
+                            self.population.y[indices] - self.start_y[indices])
+        improved = distance > (self.car_progress[indices] +
+                               STALL_MIN_PROGRESS)
+        self.car_progress[indices[improved]] = distance[improved]
+        self.car_progress_frame[indices[improved]] = self.gen_cur_frame
+
+        stalled = (self.gen_cur_frame - self.car_progress_frame[indices]
+                   >= self.stall_frames)
+        # Reward distance from start, as for drivers still running at the end
+        self.car_scores[indices[stalled]] = distance[stalled] / MAX_HYPOT
+        self.car_finished[indices[stalled]] = True
+        self.car_outcome[indices[stalled]] = OUTCOME_STALLED
+        self.gen_stall_count += int(stalled.sum())
+
+    # Returns the scores cars would get if the generation ended now
+    def current_scores(self):
+        unfinished = ~self.car_finished
+        scores = self.car_scores.copy()
+        # Reward distance from start
+        scores[unfinished] = (np.hypot(
+            self.population.x[unfinished] - self.start_x[unfinished],
+            self.population.y[unfinished] - self.start_y[unfinished]) /
+            MAX_HYPOT)
+        return scores
+
+    # Combines (levels, drivers) scores into one score per driver
+    def aggregate_scores(self, scores):
+        scores = np.reshape(scores, (len(self.levels), -1))
+        if self.aggregate == "min":
+            return scores.min(axis=0)
+        return scores.mean(axis=0)
+
+    # Calculate scores for non-collided cars and score drivers over them
+    def score_unfinished(self):
+        self.car_scores = self.current_scores()
+        self.driver_scores = self.aggregate_scores(self.car_scores)
+        self.cache_scores()
+
+    # Sort drivers by score, keeping the order of equal scores
+    def rank_drivers(self):
+        order = np.argsort(-self.driver_scores, kind="stable")
+        self.driver_scores = self.driver_scores[order]
+        self.drivers = [self.drivers[i] for i in order]
+        self.gen_concluded = True
+        if self.profiler is not None:
+            self.profiler.end_gen(self)
+
+    def conclude_gen(self):
+        self.score_unfinished()
+        self.rank_drivers()
+
+    # Best driver of the concluded generation
+    def best_driver(self):
+        return self.drivers[0]
+
+    def evolve_drivers(self):
+        assert self.selection_count > 1, \
+            "At least 2 parents required for evolution"
+        # Keep the elites and breed the rest of the generation from the best
+        # drivers at once
+        elites = self.drivers[:self.elites]
+        for driver, car in zip(elites, self.cars):
+            driver.car = car
+        self.drivers = elites + self.driver_class.breed(
+            self.drivers[:self.selection_count],
+            self.cars[self.elites:self.gen_size])
+        assert len(self.drivers) == self.gen_size, \
+            "Exactly one driver per car of a level"
+
+    # Evolves the sorted drivers of the last generation and starts a new one
+    def next_gen(self):
+        self.gen_number += 1
+        if self.profiler is not None:
+            t = self.profiler.clock()
+        self.evolve_drivers()
+        if self.profiler is not None:
+            self.profiler.lap("evolution", t)
+        self.start_gen()
+
+    def run_gen(self):
+        if self.workers > 1:
+            assert self.recorder is None, \
+                "Generations simulated by workers can't be recorded"
+            self.run_gen_parallel()
+            return
+        while not self.gen_over():
+            self.step()
+        self.conclude_gen()
+
+    # Simulates the generation as contiguous shards of drivers on a process
+    # pool, one shard per worker, then gathers the scores in driver order.
+    # Drivers with a cached score on every level are not sent to workers.
+    def run_gen_parallel(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                self.workers, initializer=init_worker,
+                initargs=(self.levels, self.worker_settings()))
+
+        level_cars = np.arange(self.car_count).reshape(len(self.levels), -1)
+        pending = np.flatnonzero(~self.car_cached[level_cars].all(axis=0))
+        shards = np.array_split(pending, self.workers)
+        futures = [self.pool.submit(evaluate_shard,
+                                    [self.drivers[i] for i in shard])
+                   for shard in shards if len(shard) > 0]
+        self.gen_cur_frame = 0
+        for shard, future in zip(shards, futures):
+            car_scores, finished, outcome, frames = future.result()
+            cars = level_cars[:, shard]
+            self.car_scores[cars] = car_scores
+            self.car_finished[cars] = finished
+            self.car_outcome[cars] = outcome
+            self.car_cached[cars] = False
+            # Shards may end early, the generation ends with the last one
+            self.gen_cur_frame = max(self.gen_cur_frame, frames)
+        self.count_outcomes()
+        self.driver_scores = self.aggregate_scores(self.car_scores)
+        self.cache_scores()
+        self.rank_drivers()
+
+    # Simulation arguments for the shards simulated by workers
+    def worker_settings(self):
+        return {"gen_frames": self.gen_frames, "raster": self.raster,
+                "stall_frames": self.stall_frames,
+                "aggregate": self.aggregate, "dt": self.dt,
+                "decision_interval": self.decision_interval}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    # Runs the given number of generations, starting with the current one
+    # unless it is already concluded (e.g. resumed from a checkpoint), and
+    # calls on_gen_end(self) after each one is concluded
+    def run(self, generations, on_gen_end=None):
+        for g in range(generations):
+            if self.gen_concluded:
+                self.next_gen()
+            self.run_gen()
+            if on_gen_end is not None:
+                on_gen_end(self)
+
+    def summary_lines(self):
+        return ["Win Rate: " + str((self.gen_win_count / self.car_count) * 100)
+                + "%",
+                "Top Scores: ",
+                "1st: " + str(self.driver_scores[0]),
+                "2nd: " + str(self.driver_scores[1]),
+                "3rd: " + str(self.driver_scores[2])]
+
+
+# Per-process level and settings of pool workers, set by init_worker
+worker_level = None
+worker_settings = {}
+
+
+def init_worker(level, settings):
+    global worker_level, worker_settings
+    worker_level = level
+    worker_settings = settings
+
+
+# Runs one generation of the given drivers on the worker's copy of the levels
+# and returns the (levels, drivers) scores, finished flags and outcomes of
+# their cars and the number of frames simulated
+def evaluate_shard(drivers):
+    sim = Simulation(worker_level, drivers=drivers, **worker_settings)
+    while not sim.gen_over():
+        sim.step()
+    sim.score_unfinished()
+    return (sim.car_scores.reshape(len(sim.levels), -1),
+            sim.car_finished.reshape(len(sim.levels), -1),
+            sim.car_outcome.reshape(len(sim.levels), -1),
+            sim.gen_cur_frame)
+
+
+def print_gen_summary(sim):
+    print("Generation " + str(sim.gen_number) + ": " +
+          " ".join(sim.summary_lines()))
+
+
+# Returns the argument parser of the training command line, which other
+# entry points extend
+def build_parser(description="Train drivers headless, without a display "
+                 "or frame cap."):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--level", default="levels/turn.json",
+                        help="level JSON file to train on")
+    parser.add_argument("--levels", nargs="+", default=None,
+                        help="train on all of these level JSON files at "
+                        "once, instead of --level")
+    parser.add_argument("--aggregate", choices=AGGREGATES,
+                        default=DEFAULT_AGGREGATE,
+                        help="how scores over several levels are combined")
+    parser.add_argument("--generations", type=int, default=10,
+                        help="number of generations to run")
+    parser.add_argument("--gen-size", type=int, default=GEN_SIZE,
+                        help="drivers per generation")
+    parser.add_argument("--gen-frames", type=int, default=GEN_FRAMES,
+                        help="frames simulated per generation")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="random seed")
+    parser.add_argument("--stall-frames", type=int, default=None,
+                        help="finish drivers which make no progress for "
+                        "this many frames")
+    parser.add_argument("--dt", type=int, default=1,
+                        help="frames simulated per step, with collisions "
+                        "swept between steps")
+    parser.add_argument("--decision-interval", type=int, default=None,
+                        help="frames between driver decisions, repeating "
+                        "the last command in between")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes to evaluate each generation on")
+    parser.add_argument("--checkpoint", default=None,
+                        help="save the population here after every "
+                        "generation")
+    parser.add_argument("--archive", default=None,
+                        help="keep the best genome of every generation here")
+    parser.add_argument("--resume", default=None,
+                        help="continue from this checkpoint")
+    parser.add_argument("--raster", action="store_true",
+                        help="test crashes and LiDAR against the compiled "
+                        "level raster")
+    parser.add_argument("--elites", type=int, default=0,
+                        help="carry this many of the best drivers over "
+                        "unchanged to the next generation")
+    parser.add_argument("--fitness-cache", action="store_true",
+                        help="reuse the scores of genomes which already "
+                        "drove a level instead of simulating them again")
+    parser.add_argument("--record-dir", default=None,
+                        help="save a command trace of every generation in "
+                        "this directory, for replay.py")
+    parser.add_argument("--profile-trace", default=None,
+                        help="time each phase and write a row per "
+                        "generation to this .csv or .jsonl file")
+    parser.add_argument("--telemetry", default=None,
+                        help="append statistics of every generation to this "
+                        ".jsonl or .sqlite file, see telemetry.py")
+    return parser
+
+
+def parse_args(args=None):
+    parser = build_parser()
+    args = parser.parse_args(args)
+    check_args(parser, args)
+    return args
+
+
+# Rejects argument combinations which the training entry points can't run
+def check_args(parser, args):
+    if args.raster and args.levels is not None:
+        parser.error("--raster is only supported on a single level, not "
+                     "with --levels")
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.levels is not None:
+        level = load_levels(args.levels)
+    else:
+        level = load_level(args.level)
+    checkpoint = None
+    drivers = None
+    if args.resume is not None:
+        checkpoint = load_checkpoint(args.resume)
+        drivers = checkpoint_drivers(checkpoint)
+    profiler = None
+    if args.profile_trace is not None:
+        profiler = Phase_Profiler(args.profile_trace)
+    recorder = None
+    if args.record_dir is not None:
+        recorder = Command_Recorder()
+    sim = Simulation(level, gen_size=args.gen_size,
+                     gen_frames=args.gen_frames, drivers=drivers,
+                     workers=args.workers, stall_frames=args.stall_frames,
+                     raster=load_raster(level) if args.raster else None,
+                     profiler=profiler, aggregate=args.aggregate,
+                     recorder=recorder, elites=args.elites,
+                     fitness_cache=Fitness_Cache() if args.fitness_cache
+                     else None, dt=args.dt,
+                     decision_interval=args.decision_interval)
+    if checkpoint is not None:
+        restore_checkpoint(sim, checkpoint)
+
+    writer = None
+    if args.checkpoint is not None:
+        writer = Checkpoint_Writer(args.checkpoint, args.archive)
+    telemetry = None
+    if args.telemetry is not None:
+        telemetry = Telemetry_Writer(args.telemetry)
+
+    def on_gen_end(sim):
+        print_gen_summary(sim)
+        if telemetry is not None:
+            telemetry.record(sim)
+        if recorder is not None:
+            recorder.save_gen(args.record_dir, sim)
+        if writer is not None:
+            writer.save(sim)
+
+    try:
+        sim.run(args.generations, on_gen_end=on_gen_end)
+    finally:
+        sim.close()
+        if writer is not None:
+            writer.close()
+        if telemetry is not None:
+            telemetry.close()
+        if profiler is not None:
+            profiler.close()
+    return sim
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+    Steady-state evolution: drivers are scored and replaced one at a time as
+    they finish, instead of all together at the end of a generation.
+    Run directly to train headless, with the arguments of simulation.py.
+"""
+
+import bisect
+import random
+import numpy as np
+from level import load_level, load_levels
+from raster import load_raster
+from profiling import Phase_Profiler
+from telemetry import Telemetry_Writer
+from simulation import Simulation, parse_args, print_gen_summary
+
+
+class Steady_State_Simulation(Simulation):
+
+    # A driver is scored as soon as all of its cars have finished (won,
+    # crashed, stalled or driven gen_frames frames). Its score goes into a
+    # ranked pool of the best selection_count drivers so far, and its slot is
+    # refilled right away with a child bred from that pool, so no car waits
+    # for the slowest one. Children of the same frame are bred in one batch.
+    #
+    # There is no generational barrier. For reporting and telemetry, a
+    # "generation" ends every gen_size scored drivers, when driver_scores
+    # holds the scores of the pool, best first. next_gen() only starts
+    # counting the next one.
+
+    def __init__(self, level, **kwargs):
+        # Ranked pool, by negated score so bisect keeps the best first
+        self.pool_keys = []
+        self.pool_drivers = []
+        self.evaluations = 0
+        self.gen_evaluations = 0
+        # gen_cur_frame runs on across generations, as cars do
+        self.gen_start_frame = 0
+        super().__init__(level, **kwargs)
+        assert self.selection_count > 1, \
+            "At least 2 parents required for evolution"
+        assert self.recorder is None and self.fitness_cache is None and \
+            self.workers == 1, "Not supported by steady-state evolution"
+
+    def gen_over(self):
+        return self.gen_evaluations >= self.gen_size
+
+    def gen_frame_count(self):
+        return self.gen_cur_frame - self.gen_start_frame
+
+    def step(self, commands=None):
+        super().step(commands)
+
+        # Cars which drove gen_frames frames are scored as at the end of a
+        # generation
+        timed_out = ~self.car_finished & (
+            self.gen_cur_frame - self.car_start_frame >= self.gen_frames)
+        if timed_out.any():
+            self.car_scores[timed_out] = self.current_scores()[timed_out]
+            self.car_finished[timed_out] = True
+
+        done = np.flatnonzero(self.car_finished.reshape(
+            len(self.levels), -1).all(axis=0))
+        if len(done) > 0:
+            self.replace_drivers(done)
+
+    # Adds a scored driver to the pool, after drivers with the same score
+    def rank_into_pool(self, driver, score):
+        i = bisect.bisect_right(self.pool_keys, -score)
+        self.pool_keys.insert(i, -score)
+        self.pool_drivers.insert(i, driver)
+        del self.pool_keys[self.selection_count:]
+        del self.pool_drivers[self.selection_count:]
+
+    # Scores the given finished drivers and replaces them with children of
+    # the pool
+    def replace_drivers(self, indices):
+        if self.profiler is not None:
+            t = self.profiler.clock()
+        scores = self.aggregate_scores(self.car_scores)[indices]
+        for i, score in zip(indices, scores):
+            self.rank_into_pool(self.drivers[i], score)
+        self.evaluations += len(indices)
+        self.gen_evaluations += len(indices)
+
+        cars = (indices[None, :] +
+                (np.arange(len(self.levels)) * self.gen_size)[:, None]).ravel()
+        if len(self.pool_drivers) > 1:
+            children = self.driver_class.breed(
+                self.pool_drivers, [self.cars[i] for i in indices])
+        else:
+            children = [self.driver_class(self.cars[i]) for i in indices]
+        for i, child in zip(indices, children):
+            self.drivers[i] = child
+        if self.driver_batch is not None:
+            # Driver stacks are a list of (weights, biases) per layer
+            for (weights, biases), (new_weights, new_biases) in zip(
+                    self.driver_batch,
+                    self.driver_class.stack_drivers(children)):
+                weights[indices] = new_weights
+                biases[indices] = new_biases
+        if self.profiler is not None:
+            self.profiler.lap("evolution", t)
+
+        self.restart_cars(cars)
+
+    # Puts the given cars back at their start for a new driver
+    def restart_cars(self, cars):
+        mask = np.zeros(self.car_count, dtype=bool)
+        mask[cars] = True
+        self.population.force_position(self.start_x[mask],
+                                       self.start_y[mask],
+                                       self.start_angle[mask], mask=mask)
+        self.population.beam_collided[cars] = False
+        for i in cars:
+            self.reset_car(i)
+        self.car_scores[cars] = 0
+        self.car_finished[cars] = False
+        self.car_outcome[cars] = 0
+        self.car_progress[cars] = 0
+        self.car_progress_frame[cars] = self.gen_cur_frame
+        self.car_start_frame[cars] = self.gen_cur_frame
+
+    def conclude_gen(self):
+        self.driver_scores = -np.array(self.pool_keys)
+        self.gen_concluded = True
+        if self.profiler is not None:
+            self.profiler.end_gen(self)
+
+    # Best driver of the pool, as drivers holds the children being scored
+    def best_driver(self):
+        return self.pool_drivers[0]
+
+    def next_gen(self):
+        self.gen_number += 1
+        self.gen_concluded = False
+        self.gen_evaluations = 0
+        self.gen_start_frame = self.gen_cur_frame
+        self.gen_win_count = 0
+        self.gen_crash_count = 0
+        self.gen_stall_count = 0
+
+    def run_gen(self):
+        while not self.gen_over():
+            self.step()
+        self.conclude_gen()
+
+
+def main(args=None):
+    args = parse_args(args)
+    assert (args.workers == 1 and args.checkpoint is None and
+            args.resume is None and args.record_dir is None and
+            args.elites == 0 and not args.fitness_cache), \
+        "Workers, checkpoints, traces, elites and the fitness cache are " \
+        "not supported by steady-state evolution"
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.levels is not None:
+        level = load_levels(args.levels)
+    else:
+        level = load_level(args.level)
+    profiler = None
+    if args.profile_trace is not None:
+        profiler = Phase_Profiler(args.profile_trace)
+    telemetry = None
+    if args.telemetry is not None:
+        telemetry = Telemetry_Writer(args.telemetry)
+    sim = Steady_State_Simulation(
+        level, gen_size=args.gen_size, gen_frames=args.gen_frames,
+        stall_frames=args.stall_frames,
+        raster=load_raster(level) if args.raster else None,
+        profiler=profiler, aggregate=args.aggregate, dt=args.dt,
+        decision_interval=args.decision_interval)
+
+    def on_gen_end(sim):
+        print_gen_summary(sim)
+        if telemetry is not None:
+            telemetry.record(sim)
+
+    try:
+        sim.run(args.generations, on_gen_end=on_gen_end)
+    finally:
+        if telemetry is not None:
+            telemetry.close()
+        if profiler is not None:
+            profiler.close()
+    return sim
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+    Hyperparameter sweeps: trains many configurations in parallel, stopping
+    the poor ones early by successive halving, and caches every run so a
+    sweep run again only trains what it hasn't yet.
+    Run directly with a JSON sweep spec, e.g. sweeps/example.json.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from drivers import One_Hidden_NN_Driver
+from level import load_level, load_levels
+from simulation import Simulation, GEN_SIZE, SELECTION_RATIO
+from checkpoint import (load_checkpoint, checkpoint_drivers,
+                        restore_checkpoint, save_checkpoint)
+
+# Configuration keys passed straight to Simulation
+SIMULATION_PARAMS = ("gen_size", "gen_frames", "selection_ratio",
+                     "stall_frames", "elites", "dt", "decision_interval",
+                     "aggregate")
+# Configuration keys which change the drivers, and the level(s) to train on
+DRIVER_PARAMS = ("hidden_width", "mutation_scale")
+LEVEL_PARAMS = ("level", "levels")
+DEFAULT_LEVEL = "levels/turn.json"
+
+SWEEP_MIN_GENERATIONS = 2
+SWEEP_MAX_GENERATIONS = 16
+# Each rung keeps 1 / eta of the configurations and trains them eta times
+# as many generations
+SWEEP_ETA = 2
+
+
+# Returns the configurations of a sweep spec: every point of its "grid"
+# (lists of values per key), each with "samples" random draws from its
+# "random" space ({"choices": [...]} or {"min", "max"} with optional "int"
+# and "log" per key), all on top of its "base" configuration
+def sweep_configs(spec):
+    rng = random.Random(spec.get("seed"))
+    grid = spec.get("grid", {})
+    space = spec.get("random", {})
+    samples = spec.get("samples", 1) if space else 1
+    configs = []
+    for point in itertools.product(*grid.values()):
+        for _ in range(samples):
+            config = dict(spec.get("base", {}))
+            config.update(zip(grid.keys(), point))
+            for key, values in space.items():
+                config[key] = sample_value(rng, values)
+            config.setdefault("seed", spec.get("seed"))
+            configs.append(config)
+    for config in configs:
+        check_config(config)
+    return configs
+
+
+# Fails on a configuration which can't train, before any run starts, rather
+# than in a worker partway through a rung
+def check_config(config):
+    unknown = set(config) - set(SIMULATION_PARAMS + DRIVER_PARAMS +
+                                LEVEL_PARAMS + ("seed",))
+    assert not unknown, "Unknown sweep parameters " + str(sorted(unknown))
+    gen_size = config.get("gen_size", GEN_SIZE)
+    parents = math.floor(gen_size * config.get("selection_ratio",
+                                               SELECTION_RATIO))
+    assert parents > 1, "Configuration " + config_key(config) + \
+        " selects fewer than 2 parents " + json.dumps(config, sort_keys=True)
+    assert 0 <= config.get("elites", 0) < gen_size, "Configuration " + \
+        config_key(config) + " leaves no room for children " + \
+        json.dumps(config, sort_keys=True)
+
+
+def sample_value(rng, values):
+    if "choices" in values:
+        return rng.choice(values["choices"])
+    low, high = values["min"], values["max"]
+    if values.get("log"):
+        value = low * (high / low) ** rng.random()
+    else:
+        value = rng.uniform(low, high)
+    if values.get("int"):
+        return int(round(value))
+    return value
+
+
+# Names the cached run of a configuration
+def config_key(config):
+    return hashlib.blake2b(json.dumps(config, sort_keys=True).encode(),
+                           digest_size=8).hexdigest()
+
+
+def config_driver_class(config):
+    attributes = {}
+    if "hidden_width" in config:
+        attributes["hidden_width"] = config["hidden_width"]
+    if "mutation_scale" in config:
+        scale = config["mutation_scale"]
+        attributes["mutation_ranges"] = tuple(
+            (low * scale, high * scale)
+            for low, high in One_Hidden_NN_Driver.mutation_ranges)
+    if not attributes:
+        return One_Hidden_NN_Driver
+    return One_Hidden_NN_Driver.variant(**attributes)
+
+
+# Trains a configuration for the given number of generations and returns
+# its history, one {"generation", "win_rate", "best_score", "mean_score"}
+# per generation. Runs are cached in directory as <key>.json and a
+# <key>.npz checkpoint, and continued from there, so a run cut short by an
+# earlier rung trains exactly as if it had never stopped.
+def run_config(config, generations, directory):
+    key = config_key(config)
+    result_path = os.path.join(directory, key + ".json")
+    checkpoint_path = os.path.join(directory, key + ".npz")
+    history = []
+    if os.path.exists(result_path):
+        with open(result_path) as f:
+            history = json.load(f)["history"]
+    if len(history) >= generations:
+        return history[:generations]
+
+    if "levels" in config:
+        level = load_levels(config["levels"])
+    else:
+        level = load_level(config.get("level", DEFAULT_LEVEL))
+    settings = {name: config[name] for name in SIMULATION_PARAMS
+                if name in config}
+    if history:
+        checkpoint = load_checkpoint(checkpoint_path)
+        sim = Simulation(level, drivers=checkpoint_drivers(checkpoint),
+                         **settings)
+        restore_checkpoint(sim, checkpoint)
+    else:
+        random.seed(config.get("seed"))
+        sim = Simulation(level, driver_class=config_driver_class(config),
+                         **settings)
+
+    def on_gen_end(sim):
+        history.append({"generation": sim.gen_number,
+                        "win_rate": sim.gen_win_count / sim.car_count,
+                        "best_score": float(sim.driver_scores[0]),
+                        "mean_score": float(sim.driver_scores.mean())})
+
+    sim.run(generations - len(history), on_gen_end=on_gen_end)
+    save_checkpoint(checkpoint_path, sim)
+    tmp_path = result_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"config": config, "history": history}, f)
+    os.replace(tmp_path, result_path)
+    return history
+
+
+# Sort key of a run after its last generation: win rate, then best score
+def run_rank(history):
+    return (history[-1]["win_rate"], history[-1]["best_score"])
+
+
+# Runs a sweep spec by successive halving: every configuration trains
+# min_generations generations, then the best 1 / eta of them train eta
+# times as long, and so on up to max_generations. Returns the last rung's
+# configurations with their histories, best first.
+def run_sweep(spec, directory, workers=1):
+    os.makedirs(directory, exist_ok=True)
+    eta = spec.get("eta", SWEEP_ETA)
+    max_generations = spec.get("max_generations", SWEEP_MAX_GENERATIONS)
+    generations = min(spec.get("min_generations", SWEEP_MIN_GENERATIONS),
+                      max_generations)
+    survivors = sweep_configs(spec)
+
+    with ProcessPoolExecutor(workers) as pool:
+        rung = 1
+        while True:
+            print("Rung " + str(rung) + ": " + str(len(survivors)) +
+                  " configurations for " + str(generations) + " generations",
+                  flush=True)
+            histories = list(pool.map(run_config, survivors,
+                                      [generations] * len(survivors),
+                                      [directory] * len(survivors)))
+            ranked = sorted(zip(survivors, histories),
+                            key=lambda run: run_rank(run[1]), reverse=True)
+            for config, history in ranked:
+                print("  " + config_line(config, history), flush=True)
+            if generations >= max_generations or len(ranked) == 1:
+                return ranked
+            survivors = [config for config, _ in
+                         ranked[:max(1, len(ranked) // eta)]]
+            generations = min(generations * eta, max_generations)
+            rung += 1
+
+
+def config_line(config, history):
+    return (config_key(config) + " win rate: " +
+            format(100 * history[-1]["win_rate"], ".1f") + "% best: " +
+            format(history[-1]["best_score"], ".3f") + " " +
+            json.dumps(config, sort_keys=True))
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description="Sweep training settings with successive halving.")
+    parser.add_argument("spec", help="JSON sweep spec")
+    parser.add_argument("--dir", default=None,
+                        help="directory caching the runs (default: the spec "
+                        "path without .json, plus _runs)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="configurations trained at once")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    with open(args.spec) as f:
+        spec = json.load(f)
+    directory = args.dir
+    if directory is None:
+        directory = os.path.splitext(args.spec)[0] + "_runs"
+    ranked = run_sweep(spec, directory, args.workers)
+    print("Best: " + config_line(*ranked[0]))
+    with open(os.path.join(directory, "summary.json"), "w") as f:
+        json.dump([{"key": config_key(config), "config": config,
+                    "history": history} for config, history in ranked], f,
+                  indent=4)
+    return ranked
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+    Telemetry: statistics of every concluded generation, appended to a JSONL
+    or SQLite store by a background thread.
+    Run directly to summarize a store, or plot it to an image.
+"""
+
+import argparse
+import json
+import queue
+import sqlite3
+import threading
+import time
+import pygame
+import numpy as np
+from fitness_cache import genome_key
+
+# Columns of a telemetry row, in order
+TELEMETRY_FIELDS = ("generation", "time", "wall_time", "frames", "cars",
+                    "wins", "crashes", "stalls", "best_score", "mean_score",
+                    "std_score", "min_score", "p25_score", "median_score",
+                    "p75_score", "best_genome")
+SQLITE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+TELEMETRY_TABLE = "generations"
+
+PLOT_WIDTH = 800
+PLOT_HEIGHT = 400
+PLOT_MARGIN = 40
+
+
+def is_sqlite_path(path):
+    return path.endswith(SQLITE_SUFFIXES)
+
+
+# Returns the telemetry row of a concluded generation of sim, which took
+# wall_time seconds
+def generation_stats(sim, wall_time):
+    scores = np.asarray(sim.driver_scores, dtype=np.float64)
+    p25, median, p75 = np.percentile(scores, (25, 50, 75))
+    best = sim.best_driver()
+    return {
+        "generation": int(sim.gen_number),
+        "time": time.time(),
+        "wall_time": wall_time,
+        "frames": int(sim.gen_frame_count()),
+        "cars": int(sim.car_count),
+        "wins": int(sim.gen_win_count),
+        "crashes": int(sim.gen_crash_count),
+        "stalls": int(sim.gen_stall_count),
+        "best_score": float(scores.max()),
+        "mean_score": float(scores.mean()),
+        "std_score": float(scores.std()),
+        "min_score": float(scores.min()),
+        "p25_score": float(p25),
+        "median_score": float(median),
+        "p75_score": float(p75),
+        # Drivers without a genome (e.g. scripted ones) have no id
+        "best_genome": genome_key(best.genome()).hex()
+        if hasattr(best, "genome") else None,
+    }
+
+
+class Telemetry_Writer():
+
+    # Appends a row of generation_stats() per record() call to a JSONL file,
+    # or to a table of an SQLite database for paths ending in .sqlite,
+    # .sqlite3 or .db. record() only computes the row and queues it; a
+    # background thread does all file and database work, so the simulation
+    # never waits on disk. Unlike checkpoints, no row is ever dropped.
+    # A row's wall_time is the time since the last row (or the writer was
+    # created), as for Phase_Profiler. If the store can't be opened or
+    # written, the writer stops and the error is raised again from the next
+    # record() or from close().
+
+    def __init__(self, path):
+        self.path = path
+        self.clock = time.perf_counter
+        self.gen_start = self.clock()
+        self.error = None
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def record(self, sim):
+        self._raise_error()
+        now = self.clock()
+        self.pending.put(generation_stats(sim, now - self.gen_start))
+        self.gen_start = now
+
+    def _write_loop(self):
+        try:
+            self._write_rows()
+        except Exception as error:
+            self.error = error
+
+    def _write_rows(self):
+        if is_sqlite_path(self.path):
+            # SQLite connections stay on the thread which opened them
+            store = sqlite3.connect(self.path)
+            store.execute("CREATE TABLE IF NOT EXISTS " + TELEMETRY_TABLE +
+                          " (" + ", ".join(TELEMETRY_FIELDS) + ")")
+            insert = ("INSERT INTO " + TELEMETRY_TABLE + " VALUES (" +
+                      ", ".join("?" * len(TELEMETRY_FIELDS)) + ")")
+        else:
+            store = open(self.path, "a")
+        try:
+            while True:
+                row = self.pending.get()
+                if row is None:
+                    return
+                if is_sqlite_path(self.path):
+                    store.execute(insert, [row[field]
+                                           for field in TELEMETRY_FIELDS])
+                    store.commit()
+                else:
+                    store.write(json.dumps(row) + "\n")
+                    store.flush()
+        finally:
+            store.close()
+
+    # Waits for every queued row to be written and stops the thread
+    def close(self):
+        self.pending.put(None)
+        self.thread.join()
+        self._raise_error()
+
+
+# Yields the rows of a telemetry store one at a time, so stores of any size
+# are read in constant memory
+def read_telemetry(path):
+    if is_sqlite_path(path):
+        store = sqlite3.connect(path)
+        try:
+            cursor = store.execute("SELECT " + ", ".join(TELEMETRY_FIELDS) +
+                                   " FROM " + TELEMETRY_TABLE +
+                                   " ORDER BY rowid")
+            for values in cursor:
+                yield dict(zip(TELEMETRY_FIELDS, values))
+        finally:
+            store.close()
+    else:
+        with open(path) as store:
+            for line in store:
+                if line.strip():
+                    yield json.loads(line)
+
+
+# Returns summary lines of a telemetry store, reading it in one pass
+def summarize(path):
+    count = 0
+    wall_time = frames = wins = cars = 0
+    best = None
+    first = last = None
+    for row in read_telemetry(path):
+        count += 1
+        wall_time += row["wall_time"]
+        frames += row["frames"]
+        wins += row["wins"]
+        cars += row["cars"]
+        if best is None or row["best_score"] > best["best_score"]:
+            best = row
+        if first is None:
+            first = row
+        last = row
+    if count == 0:
+        return ["No generations in " + path]
+    return ["Generations: " + str(count) + " (" + str(first["generation"]) +
+            " to " + str(last["generation"]) + ")",
+            "Wall time: " + format(wall_time, ".1f") + "s, " +
+            format(wall_time / count, ".3f") + "s per generation",
+            "Frames: " + str(frames) + ", " +
+            format(frames / max(wall_time, 1e-9), ".0f") + " per second",
+            "Win rate: " + format(100 * wins / cars, ".1f") + "%",
+            "Best score: " + str(best["best_score"]) + " in generation " +
+            str(best["generation"]) + " (genome " + str(best["best_genome"]) +
+            ")",
+            "Last generation: best " + str(last["best_score"]) + " mean " +
+            format(last["mean_score"], ".3f") + " median " +
+            format(last["median_score"], ".3f")]
+
+
+# Plots the best, mean and min score per generation to an image with pygame.
+# Rows are merged into at most PLOT_WIDTH buckets as they are read (a first
+# pass counts them), so memory doesn't grow with the store.
+def plot(path, image_path):
+    count = sum(1 for _ in read_telemetry(path))
+    buckets = max(1, min(count, PLOT_WIDTH))
+    best = np.full(buckets, -np.inf)
+    low = np.full(buckets, np.inf)
+    mean = np.zeros(buckets)
+    rows = np.zeros(buckets)
+    for i, row in enumerate(read_telemetry(path)):
+        b = i * buckets // max(count, 1)
+        best[b] = max(best[b], row["best_score"])
+        low[b] = min(low[b], row["min_score"])
+        mean[b] += row["mean_score"]
+        rows[b] += 1
+    mean /= np.maximum(rows, 1)
+
+    surface = pygame.Surface((PLOT_WIDTH + 2 * PLOT_MARGIN,
+                              PLOT_HEIGHT + 2 * PLOT_MARGIN))
+    surface.fill("#202020")
+    if count > 0:
+        top = max(best.max(), 1e-9)
+        bottom = min(low.min(), 0)
+        for series, color in ((best, "#99ee99"), (mean, "#FBBA00"),
+                              (low, "#ee9999")):
+            points = [(PLOT_MARGIN + b * PLOT_WIDTH / max(buckets - 1, 1),
+                       PLOT_MARGIN + PLOT_HEIGHT *
+                       (top - value) / (top - bottom))
+                      for b, value in enumerate(series.tolist())]
+            if len(points) == 1:
+                points.append(points[0])
+            pygame.draw.lines(surface, color, False, points, 2)
+    pygame.draw.rect(surface, "#aaaaaa", (PLOT_MARGIN, PLOT_MARGIN,
+                                          PLOT_WIDTH, PLOT_HEIGHT), 1)
+    pygame.image.save(surface, image_path)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        description="Summarize a telemetry store.")
+    parser.add_argument("store", help="telemetry .jsonl or .sqlite file")
+    parser.add_argument("--plot", default=None,
+                        help="also plot best (green), mean (yellow) and min "
+                        "(red) scores per generation to this image file")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    for line in summarize(args.store):
+        print(line)
+    if args.plot is not None:
+        plot(args.store, args.plot)
+        print("Plotted to " + args.plot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import simulation
+from level import load_level
+from simulation import Simulation
+from checkpoint import Checkpoint_Writer
+
+LEVEL_PATH = os.path.join(ROOT, "levels", "turn.json")
+TRAINING_ARGS = ["--level", LEVEL_PATH, "--seed", "1", "--gen-size", "10",
+                 "--gen-frames", "100"]
+
+
+def test_write_to_missing_directory_raises(tmp_path):
+    sim = Simulation(load_level(LEVEL_PATH), gen_size=4, gen_frames=1)
+    sim.run(1)
+    writer = Checkpoint_Writer(str(tmp_path / "missing" / "ck.npz"))
+    writer.save(sim)
+    # The failed write surfaces from close() instead of killing the writer
+    # thread and hanging close()
+    with pytest.raises(FileNotFoundError):
+        writer.close()
+    assert not writer.thread.is_alive()
+
+
+def test_checkpoint_written(tmp_path):
+    sim = Simulation(load_level(LEVEL_PATH), gen_size=4, gen_frames=1)
+    sim.run(1)
+    path = str(tmp_path / "ck.npz")
+    writer = Checkpoint_Writer(path)
+    writer.save(sim)
+    writer.close()
+    assert os.path.exists(path)
+
+
+def test_resume_matches_uninterrupted_run(tmp_path):
+    path = str(tmp_path / "ck.npz")
+    uninterrupted = simulation.main(TRAINING_ARGS + ["--generations", "4"])
+    simulation.main(TRAINING_ARGS + ["--generations", "2",
+                                     "--checkpoint", path])
+    resumed = simulation.main(TRAINING_ARGS + ["--generations", "2",
+                                               "--resume", path])
+    assert resumed.gen_number == uninterrupted.gen_number == 4
+    np.testing.assert_array_equal(resumed.driver_scores,
+                                  uninterrupted.driver_scores)
+    assert ([driver.genome().tolist() for driver in resumed.drivers] ==
+            [driver.genome().tolist() for driver in uninterrupted.drivers])
@@ -0,0 +1,83 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from objects import LiDAR_Car
+from level import load_level, SCREEN_WIDTH, SCREEN_HEIGHT
+from collision import beam_hits, body_hits, body_edges
+
+LEVEL_PATHS = [os.path.join(ROOT, "levels", name)
+               for name in ("straight.json", "turn.json")]
+CARS = 500
+
+
+# LiDAR cars at random poses all over the screen, with their corners and
+# beams updated
+def random_cars(seed):
+    rng = np.random.default_rng(seed)
+    cars = []
+    for x, y, angle in zip(rng.uniform(0, SCREEN_WIDTH, CARS),
+                           rng.uniform(0, SCREEN_HEIGHT, CARS),
+                           rng.uniform(-360, 360, CARS)):
+        car = LiDAR_Car(float(x), float(y), float(angle))
+        car.position_frame_update()
+        cars.append(car)
+    return cars
+
+
+def car_corners(cars):
+    return np.array([(car.corner_b_l, car.corner_b_r, car.corner_f_r,
+                      car.corner_f_l) for car in cars])
+
+
+# Candidate rects of every segment from the grid, even for indexes small
+# enough that query_rects() would return all rects
+def grid_rects(index, starts, ends):
+    return index.padded_rects[index.query(starts, ends)]
+
+
+# body_hits() must agree with Car.collide_rect (pygame.Rect.clipline) on
+# crash and goal rects, tested against all rects and against grid candidates
+@pytest.mark.parametrize("level_path", LEVEL_PATHS)
+def test_body_hits_match_clipline(level_path):
+    level = load_level(level_path)
+    cars = random_cars(0)
+    corners = car_corners(cars)
+    starts, ends = body_edges(corners)
+    for rects, array, index in (
+            (level.obstacles + level.borders, level.crash_rects,
+             level.crash_index),
+            (level.goals, level.goal_rects, level.goal_index)):
+        expected = np.array([any(car.collide_rect(rect) for rect in rects)
+                             for car in cars])
+        assert expected.any() and not expected.all()
+        np.testing.assert_array_equal(body_hits(corners, array), expected)
+        np.testing.assert_array_equal(
+            body_hits(corners, grid_rects(index, starts, ends)), expected)
+
+
+# beam_hits() must agree with LiDAR_Car.beam_collide_rect
+@pytest.mark.parametrize("level_path", LEVEL_PATHS)
+def test_beam_hits_match_clipline(level_path):
+    level = load_level(level_path)
+    cars = random_cars(1)
+    rects = level.obstacles + level.borders
+    # clipline returns the clipped segment, empty when there is no hit
+    expected = np.array([[any(car.beam_collide_rect(rect)[b]
+                              for rect in rects)
+                          for b in range(len(car.beam_angles))]
+                         for car in cars])
+    assert expected.any() and not expected.all()
+    origins = np.array([(car.x, car.y) for car in cars])
+    endpoints = np.array([car.beam_endpoints for car in cars])
+    starts = np.broadcast_to(origins[:, None, :], endpoints.shape)
+    np.testing.assert_array_equal(
+        beam_hits(origins, endpoints, level.crash_rects), expected)
+    np.testing.assert_array_equal(
+        beam_hits(origins, endpoints,
+                  grid_rects(level.crash_index, starts, endpoints)),
+        expected)
@@ -0,0 +1,60 @@
+import os
+import sys
+import random
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from objects import LiDAR_Car
+from ann import FC_NNLayer
+from drivers import No_Hidden_NN_Driver, One_Hidden_NN_Driver
+
+DRIVER_CLASSES = [No_Hidden_NN_Driver, One_Hidden_NN_Driver,
+                  One_Hidden_NN_Driver.variant(hidden_width=8)]
+DRIVERS = 50
+
+
+# batch_drive_command() must return exactly what drive_command() returns for
+# each driver, for random beam flags and speeds (including reversing), also
+# for a shuffled subset of the stacked drivers
+@pytest.mark.parametrize("driver_class", DRIVER_CLASSES)
+def test_batch_drive_command_matches_drive_command(driver_class):
+    random.seed(0)
+    rng = np.random.default_rng(0)
+    cars = [LiDAR_Car(0, 0, 0) for _ in range(DRIVERS)]
+    drivers = [driver_class(car) for car in cars]
+    for car in cars:
+        car.beam_collided = (rng.random(len(car.beam_angles)) < 0.5).tolist()
+        car.speed = float(rng.uniform(-car.max_speed, car.max_speed))
+    stacked = driver_class.stack_drivers(drivers)
+    indices = rng.permutation(DRIVERS)[:DRIVERS // 2]
+
+    forward, turn_left = driver_class.batch_drive_command(
+        stacked, [cars[i].beam_collided for i in indices],
+        [cars[i].speed for i in indices], cars[0].max_speed, indices)
+    expected = np.array([drivers[i].drive_command() for i in indices])
+    np.testing.assert_array_equal(forward, expected[:, 0])
+    np.testing.assert_array_equal(turn_left, expected[:, 1])
+
+
+def test_batch_forward_matches_forward():
+    random.seed(0)
+    layers = [FC_NNLayer(5, 3) for _ in range(DRIVERS)]
+    for layer in layers:
+        layer.randomize_weights_biases(-2, 2)
+    inputs = np.random.default_rng(0).uniform(-1, 1, (DRIVERS, 5))
+    weights, biases = FC_NNLayer.stack_layers(layers)
+    np.testing.assert_array_equal(
+        FC_NNLayer.batch_forward(weights, biases, inputs),
+        [layer.forward(input) for layer, input in zip(layers, inputs)])
+
+
+def test_forward_rejects_wrong_input_size():
+    layer = FC_NNLayer(4, 2)
+    with pytest.raises(AssertionError):
+        layer.forward([0, 0, 0, 0, 0])
+    weights, biases = FC_NNLayer.stack_layers([layer])
+    with pytest.raises(AssertionError):
+        FC_NNLayer.batch_forward(weights, biases, np.zeros((1, 3)))
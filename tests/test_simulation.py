@@ -0,0 +1,52 @@
+import os
+import sys
+import random
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from level import load_level, load_levels
+from simulation import Simulation
+from fitness_cache import Fitness_Cache
+
+LEVEL_PATHS = [os.path.join(ROOT, "levels", name)
+               for name in ("turn.json", "straight.json")]
+GENERATIONS = 3
+
+
+# Runs seeded generations and returns the ranked scores and genomes of each
+def run_generations(workers, multi_level, elites, fitness_cache):
+    random.seed(1)
+    if multi_level:
+        levels = load_levels(LEVEL_PATHS)
+    else:
+        levels = load_level(LEVEL_PATHS[0])
+    sim = Simulation(levels, gen_size=12, gen_frames=150, workers=workers,
+                     elites=elites, fitness_cache=Fitness_Cache()
+                     if fitness_cache else None)
+    generations = []
+    try:
+        for g in range(GENERATIONS):
+            if g > 0:
+                sim.next_gen()
+            sim.run_gen()
+            generations.append((sim.driver_scores.copy(),
+                                [driver.genome() for driver in sim.drivers]))
+    finally:
+        sim.close()
+    return generations
+
+
+# Results must not depend on the number of workers, also with elites, the
+# fitness cache and several levels
+@pytest.mark.parametrize("multi_level", [False, True])
+@pytest.mark.parametrize("elites, fitness_cache", [(0, False), (2, False),
+                                                   (2, True)])
+def test_workers_do_not_change_results(multi_level, elites, fitness_cache):
+    for (scores_1, genomes_1), (scores_2, genomes_2) in zip(
+            run_generations(1, multi_level, elites, fitness_cache),
+            run_generations(2, multi_level, elites, fitness_cache)):
+        np.testing.assert_array_equal(scores_1, scores_2)
+        np.testing.assert_array_equal(genomes_1, genomes_2)